@@ -0,0 +1,92 @@
+"""Benchmark exact vs IVF face gallery search: recall@1 and latency by gallery size.
+
+Usage: python benchmarks/ann_benchmark.py --sizes 10000 50000 100000 --nprobe 4 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from face_index import FaceGalleryIndex, IVFPartitioner
+
+
+def synthetic_gallery(size, dim=128, per_identity=5, noise=0.035, seed=0):
+    """OpenFace-like unit vectors: a few noisy samples around each identity centre."""
+    rng = np.random.default_rng(seed)
+    identities = max(1, size // per_identity)
+    centres = rng.normal(size=(identities, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    labels = rng.integers(0, identities, size)
+    vectors = centres[labels] + rng.normal(scale=noise, size=(size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return centres, vectors
+
+
+def make_queries(centres, count, noise=0.035, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, centres.shape[0], count)
+    queries = centres[picks] + rng.normal(scale=noise, size=(count, centres.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_queries(index, queries, **kwargs):
+    latencies = []
+    results = []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(index.search(q, k=1, **kwargs))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return results, np.asarray(latencies)
+
+
+def run(sizes, nprobes, queries_per_size):
+    report = []
+    for size in sizes:
+        centres, vectors = synthetic_gallery(size)
+        rows = [(i, i, vectors[i], 10.0) for i in range(size)]
+        index = FaceGalleryIndex(ann=IVFPartitioner(min_size=0))
+
+        start = time.perf_counter()
+        index.load(rows)
+        build_seconds = time.perf_counter() - start
+
+        queries = make_queries(centres, queries_per_size)
+        exact, exact_ms = time_queries(index, queries, exact=True)
+        truth = [r[0][0] for r in exact]
+
+        entry = {
+            'gallery_size': size,
+            'nlist': int(index.ann.centroids.shape[0]),
+            'build_seconds': round(build_seconds, 3),
+            'exact': {
+                'p50_ms': round(float(np.percentile(exact_ms, 50)), 3),
+                'p99_ms': round(float(np.percentile(exact_ms, 99)), 3),
+            },
+            'ivf': [],
+        }
+        for nprobe in nprobes:
+            approx, approx_ms = time_queries(index, queries, nprobe=nprobe)
+            hits = sum(1 for r, t in zip(approx, truth) if r and r[0][0] == t)
+            entry['ivf'].append({
+                'nprobe': nprobe,
+                'recall_at_1': round(hits / len(truth), 4),
+                'p50_ms': round(float(np.percentile(approx_ms, 50)), 3),
+                'p99_ms': round(float(np.percentile(approx_ms, 99)), 3),
+            })
+        report.append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.nprobe, args.queries), indent=2))
@@ -0,0 +1,185 @@
+"""Micro-batched embedding pool throughput against batch size 1.
+
+Concurrent clients each submit one image at a time, as /api/faces/image/* requests do, and every
+max batch size is measured for the same duration. With --model-dir the real SSD + OpenFace networks
+(FaceEncoder) are used on the images in --images (or random frames); without it a synthetic
+Darknet CNN on 96x96 crops stands in, so the pool and the DNN batching cost can be measured
+without the model files.
+
+Usage: python benchmarks/embedding_pool_benchmark.py --batch-sizes 1 4 8 16 --concurrency 16 --duration 10
+       python benchmarks/embedding_pool_benchmark.py --model-dir src --images photos/ --workers 2
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from embedding_pool import EmbeddingWorkerPool
+from server_throughput import summarize
+
+
+class SyntheticEncoder:
+    """Stand-in for FaceEncoder: one forward pass of a small Darknet CNN per encode_images() call."""
+
+    def __init__(self, cfg_path, weights_path, size=96):
+        self.size = size
+        self.net = cv2.dnn.readNetFromDarknet(cfg_path, weights_path)
+
+    def encode_images(self, images):
+        blob = cv2.dnn.blobFromImages(images, 1.0 / 255, (self.size, self.size), (0, 0, 0), swapRB=True, crop=False)
+        self.net.setInput(blob)
+        vectors = self.net.forward().reshape(len(images), -1)
+        return [(vector, 'ok') for vector in vectors]
+
+
+def write_synthetic_network(directory, layers, size=96, seed=0):
+    """Darknet cfg + weights for `layers` 3x3 conv layers (stride 2 on every other layer up to 6x6)."""
+    rng = np.random.default_rng(seed)
+    cfg = [f'[net]\nbatch=1\nwidth={size}\nheight={size}\nchannels=3\n']
+    weights = [np.array([0, 2, 0], dtype=np.int32).tobytes(), np.array([0], dtype=np.int64).tobytes()]
+    channels, spatial = 3, size
+    for i in range(layers):
+        filters = min(32 * 2 ** (i // 2), 256)
+        stride = 2 if i % 2 == 0 and spatial > 6 else 1
+        spatial = (spatial + stride - 1) // stride
+        cfg.append(f'[convolutional]\nfilters={filters}\nsize=3\nstride={stride}\npad=1\nactivation=leaky\n')
+        weights.append((rng.normal(size=filters) * 0.01).astype(np.float32).tobytes())
+        weights.append((rng.normal(size=filters * channels * 9) * np.sqrt(2.0 / (channels * 9))).astype(np.float32).tobytes())
+        channels = filters
+
+    cfg_path = os.path.join(directory, 'synthetic.cfg')
+    weights_path = os.path.join(directory, 'synthetic.weights')
+    with open(cfg_path, 'w') as f:
+        f.write('\n'.join(cfg))
+    with open(weights_path, 'wb') as f:
+        f.write(b''.join(weights))
+    return cfg_path, weights_path
+
+
+def load_images(pattern_dir, count, size, seed=0):
+    if pattern_dir:
+        paths = sorted(
+            path for path in glob.glob(os.path.join(pattern_dir, '**', '*'), recursive=True)
+            if path.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.webp'))
+        )[:count]
+        images = [image for image in (cv2.imread(path) for path in paths) if image is not None]
+        if images:
+            return images
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def drive(pool, images, concurrency, duration):
+    """`concurrency` client threads submitting single images until the deadline."""
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client(offset):
+        local = []
+        failed = 0
+        i = offset
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                pool.encode_images([images[i % len(images)]])
+                local.append((time.perf_counter() - start) * 1000.0)
+            except Exception:
+                failed += 1
+            i += concurrency
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='embedding_pool_bench_')
+    if args.model_dir:
+        from face_recognition_system import FaceEncoder
+        encoder_factory = lambda: FaceEncoder(args.model_dir)
+        images = load_images(args.images, args.image_count, 300)
+    else:
+        cfg_path, weights_path = write_synthetic_network(workdir, args.synthetic_layers)
+        encoder_factory = lambda: SyntheticEncoder(cfg_path, weights_path)
+        images = load_images(args.images, args.image_count, 96)
+    cv2.setNumThreads(args.dnn_threads)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'config': {
+            'encoder': 'FaceEncoder' if args.model_dir else f'synthetic ({args.synthetic_layers} conv layers)',
+            'workers': args.workers,
+            'max_wait_ms': args.max_wait_ms,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'dnn_threads': args.dnn_threads
+        },
+        'results': []
+    }
+
+    baseline = None
+    for batch_size in args.batch_sizes:
+        pool = EmbeddingWorkerPool(
+            encoder_factory,
+            workers=args.workers,
+            max_batch_size=batch_size,
+            max_wait=args.max_wait_ms / 1000.0 if batch_size > 1 else 0.0,
+            max_queue=max(args.concurrency * 4, 64),
+            name=f'bench-{batch_size}'
+        )
+        pool.start()
+        drive(pool, images, args.concurrency, args.warmup)
+        entry = dict(drive(pool, images, args.concurrency, args.duration), max_batch_size=batch_size)
+        metrics = pool.metrics()
+        pool.stop()
+
+        entry['images_per_sec'] = entry.pop('throughput_rps')
+        entry['avg_batch_size'] = round(metrics['avg_batch_size'], 2)
+        if baseline is None and batch_size == 1:
+            baseline = entry['images_per_sec']
+        if baseline:
+            entry['speedup_vs_batch_1'] = round(entry['images_per_sec'] / baseline, 2)
+        report['results'].append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of load before each measurement')
+    parser.add_argument('--model-dir', help='directory with the Caffe/Torch models; synthetic network otherwise')
+    parser.add_argument('--images', help='directory of images to submit (random frames otherwise)')
+    parser.add_argument('--image-count', type=int, default=64)
+    parser.add_argument('--synthetic-layers', type=int, default=12)
+    parser.add_argument('--dnn-threads', type=int, default=1, help='cv2.setNumThreads for the run')
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
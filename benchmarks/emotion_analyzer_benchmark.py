@@ -0,0 +1,95 @@
+"""Benchmark EmotionAnalyzer construction: per-entry parsing vs one-pass dict input vs columnar arrays.
+
+Usage: python benchmarks/emotion_analyzer_benchmark.py --sizes 10000 100000 1000000 --legacy-max 100000
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utils import EmotionAnalyzer
+
+EMOTIONS = ['happy', 'sad', 'angry', 'surprised', 'fearful', 'disgusted', 'neutral']
+
+SnapshotRow = namedtuple('SnapshotRow', ['timestamp', 'emotions_data'])
+
+
+def synthetic_readings(size, hz=10, seed=0):
+    """10 Hz readings: epoch-ms timestamps and an N x E percentage matrix."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2025-08-01T15:00:00', 'ms').astype(np.int64)
+    timestamps = start + np.arange(size, dtype=np.int64) * (1000 // hz)
+    matrix = rng.dirichlet(np.ones(len(EMOTIONS)), size) * 100.0
+    return timestamps, matrix
+
+
+def as_history(timestamps, matrix):
+    iso = np.datetime_as_string(timestamps.astype('datetime64[ms]'), unit='ms', timezone='UTC')
+    return {'emotion_history_20s': [
+        {'timestamp': ts, 'emotion_percentage': dict(zip(EMOTIONS, row))}
+        for ts, row in zip(iso.tolist(), matrix.tolist())
+    ]}
+
+
+def as_snapshots(timestamps, matrix):
+    start = datetime(1970, 1, 1)
+    return [
+        SnapshotRow(start + timedelta(milliseconds=ts), json.dumps(dict(zip(EMOTIONS, row))))
+        for ts, row in zip(timestamps.tolist(), matrix.tolist())
+    ]
+
+
+def legacy_process(data):
+    """The previous _process_data: pd.to_datetime and a dict per entry."""
+    emotion_types = list(data['emotion_history_20s'][0]['emotion_percentage'].keys())
+    records = []
+    for entry in data['emotion_history_20s']:
+        record = {'timestamp': pd.to_datetime(entry['timestamp'])}
+        for emotion_type in emotion_types:
+            record[emotion_type] = entry['emotion_percentage'].get(emotion_type, 0)
+        records.append(record)
+    return pd.DataFrame(records)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start, 4)
+
+
+def run(sizes, legacy_max):
+    report = []
+    for size in sizes:
+        timestamps, matrix = synthetic_readings(size)
+        history = as_history(timestamps, matrix)
+        snapshots = as_snapshots(timestamps, matrix)
+
+        entry = {'readings': size}
+        if size <= legacy_max:
+            _, entry['legacy_dict_seconds'] = timed(lambda: legacy_process(history))
+        analyzer, entry['dict_seconds'] = timed(lambda: EmotionAnalyzer(history))
+        _, entry['snapshots_seconds'] = timed(lambda: EmotionAnalyzer.from_snapshots(snapshots))
+        columnar, entry['arrays_seconds'] = timed(lambda: EmotionAnalyzer.from_arrays(timestamps, matrix, EMOTIONS))
+        _, entry['statistics_seconds'] = timed(columnar.get_emotion_statistics)
+        if 'legacy_dict_seconds' in entry:
+            entry['dict_speedup'] = round(entry['legacy_dict_seconds'] / entry['dict_seconds'], 1)
+
+        report.append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=100000, help='skip the per-entry baseline above this size')
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.legacy_max), indent=2))
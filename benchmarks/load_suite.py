@@ -0,0 +1,236 @@
+"""Seeded load test of the key API routes: throughput and p50/p95/p99 latency as JSON.
+
+Seeds a temporary SQLite database with users, sessions, snapshots and face encodings,
+starts the app (dev server or src/wsgi.py) against it and drives each route with concurrent clients.
+
+Usage: python benchmarks/load_suite.py --users 2000 --snapshots 200000 --faces 5000 \
+           --server waitress --concurrency 16 --duration 15 --output run.json [--baseline previous.json]
+"""
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from server_throughput import ServerProcess, run_load
+from ann_benchmark import synthetic_gallery, make_queries
+
+ROUTES = ('analyze', 'recognize', 'overview', 'users_list')
+EMOTIONS = ('happy', 'sad', 'angry', 'surprised', 'fearful', 'disgusted', 'neutral')
+
+
+def seed_database(database_url, users, sessions_per_user, snapshots, faces, days=30, seed=0, chunk_size=5000):
+    """Bulk-insert synthetic data with the app's models; returns what the workload needs."""
+    from flask import Flask
+    from models import db, init_db, User, UserSession, EmotionSnapshot, FaceEncoding
+    from ingest import build_snapshot_row
+    from rollups import rebuild_rollups
+
+    rng = random.Random(seed)
+    app = Flask('load_suite_seed')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    with redirect_stdout(sys.stderr):  # keep stdout for the JSON report
+        init_db(app)
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=days)
+    with app.app_context():
+        db.session.execute(db.insert(User), [
+            {
+                'name': f'user_{i}',
+                'email': None if i % 3 == 0 else f'user_{i}@example.com',
+                'is_guest': i % 3 == 0,
+                'detected_gender': rng.choice(('male', 'female')),
+                'detected_age': rng.randint(16, 70),
+                'created_at': start + timedelta(seconds=rng.uniform(0, days * 86400)),
+                'last_seen': now - timedelta(seconds=rng.uniform(0, days * 86400))
+            }
+            for i in range(users)
+        ])
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+
+        session_rows = []
+        for user_id in user_ids:
+            for _ in range(sessions_per_user):
+                started = start + timedelta(seconds=rng.uniform(0, days * 86400))
+                session_rows.append({
+                    'session_id': str(uuid.UUID(int=rng.getrandbits(128))),
+                    'user_id': user_id,
+                    'start_time': started,
+                    'end_time': started + timedelta(minutes=rng.uniform(1, 60)) if rng.random() < 0.7 else None,
+                    'is_active': True,
+                    'expires_at': now + timedelta(days=30)
+                })
+        db.session.execute(db.insert(UserSession), session_rows)
+
+        for offset in range(0, snapshots, chunk_size):
+            rows = []
+            for _ in range(min(chunk_size, snapshots - offset)):
+                session = rng.choice(session_rows)
+                emotions = {emotion: rng.uniform(0, 100) for emotion in EMOTIONS}
+                rows.append(build_snapshot_row(
+                    session['user_id'],
+                    session['session_id'],
+                    {'emotions': emotions, 'face_data': {'face_detected': True, 'face_confidence': rng.random()}},
+                    timestamp=start + timedelta(seconds=rng.uniform(0, days * 86400))
+                ))
+            db.session.execute(db.insert(EmotionSnapshot), rows)
+            db.session.commit()
+
+        centres, vectors = synthetic_gallery(max(faces, 1), seed=seed)
+        for offset in range(0, faces, chunk_size):
+            db.session.execute(db.insert(FaceEncoding), [
+                {
+                    'user_id': user_ids[i % len(user_ids)],
+                    'encoding_data': FaceEncoding.encode_encoding(vectors[i]),
+                    'label': 'seed',
+                    'confidence_threshold': 0.6,
+                    'usage_count': 0
+                }
+                for i in range(offset, min(offset + chunk_size, faces))
+            ])
+        db.session.commit()
+
+        rebuild_rollups(chunk_size=chunk_size)
+        db.session.remove()
+        db.engine.dispose()
+
+    return {
+        'session_ids': [row['session_id'] for row in session_rows if row['end_time'] is None] or
+                       [row['session_id'] for row in session_rows],
+        'max_user_id': max(user_ids),
+        'queries': make_queries(centres, 256, seed=seed + 1) if faces else None
+    }
+
+
+def route_requests(seeded, users, seed=0):
+    """Request factories per route; each returns (method, path, body, headers, route)."""
+    rng = random.Random(seed)
+    sessions = seeded['session_ids']
+    queries = seeded['queries']
+    pages = max(1, users // 20)
+
+    def analyze(i):
+        emotions = {emotion: rng.uniform(0, 100) for emotion in EMOTIONS}
+        body = {'emotions': emotions, 'face_data': {'face_detected': True, 'face_confidence': 0.9}}
+        return 'POST', '/api/emotions/analyze', body, {'X-Session-ID': sessions[i % len(sessions)]}, 'analyze'
+
+    def recognize(i):
+        body = {'face_encoding': queries[i % len(queries)].tolist()}
+        return 'POST', '/api/faces/recognize', body, {'X-Session-ID': sessions[i % len(sessions)]}, 'recognize'
+
+    def overview(i):
+        period = ('today', 'week', 'month')[i % 3]
+        return 'GET', f'/api/statistics/overview?period={period}', None, None, 'overview'
+
+    def users_list(i):
+        if i % 2:
+            return 'GET', f'/api/users/list?per_page=20&cursor={rng.randint(0, seeded["max_user_id"])}', None, None, 'users_list'
+        return 'GET', f'/api/users/list?per_page=20&page={rng.randint(1, pages)}', None, None, 'users_list'
+
+    factories = {'analyze': analyze, 'overview': overview, 'users_list': users_list}
+    if queries is not None:
+        factories['recognize'] = recognize
+    return factories
+
+
+def compare(report, baseline):
+    """Relative change per route against a previous report: throughput up is better, p95/p99 up is worse."""
+    deltas = {}
+    for route, current in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        deltas[route] = {
+            'throughput_change': round(current['throughput_rps'] / previous['throughput_rps'] - 1, 3)
+            if previous['throughput_rps'] else None,
+            'p95_change': round(current['p95_ms'] / previous['p95_ms'] - 1, 3) if previous['p95_ms'] else None,
+            'p99_change': round(current['p99_ms'] / previous['p99_ms'] - 1, 3) if previous['p99_ms'] else None
+        }
+    return deltas
+
+
+def run(args):
+    seeded = {}
+
+    def prepare(database_url):
+        started = time.perf_counter()
+        seeded.update(seed_database(
+            database_url, args.users, args.sessions_per_user, args.snapshots, args.faces, seed=args.seed
+        ))
+        seeded['seconds'] = round(time.perf_counter() - started, 2)
+
+    report = {
+        'started_at': datetime.utcnow().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'config': {
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'users': args.users,
+            'sessions_per_user': args.sessions_per_user,
+            'snapshots': args.snapshots,
+            'faces': args.faces
+        },
+        'routes': {}
+    }
+
+    env = {'EMOTION_WRITE_BEHIND': '1'} if args.write_behind else {}
+    with ServerProcess(args.server, workers=args.workers, threads=args.threads, env=env,
+                       prepare=prepare, startup_timeout=300) as address:
+        report['seed_seconds'] = seeded['seconds']
+        factories = route_requests(seeded, args.users, seed=args.seed)
+        for route in args.routes:
+            if route not in factories:
+                continue
+            make_request = factories[route]
+            run_load(address, make_request, args.concurrency, total=args.concurrency * args.warmup)
+            results = run_load(address, make_request, args.concurrency, duration=args.duration)
+            report['routes'][route] = results[route]
+            print(json.dumps({route: results[route]}), file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['baseline'] = args.baseline
+            report['comparison'] = compare(report, json.load(f))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['dev', 'waitress', 'gunicorn'], default='waitress')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--warmup', type=int, default=5, help='warm-up requests per client')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sessions-per-user', type=int, default=3)
+    parser.add_argument('--snapshots', type=int, default=100000)
+    parser.add_argument('--faces', type=int, default=2000)
+    parser.add_argument('--write-behind', action='store_true', help='run with EMOTION_WRITE_BEHIND=1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
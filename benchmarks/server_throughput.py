@@ -0,0 +1,233 @@
+"""Compare request throughput of the Flask dev server against the production WSGI entry point.
+
+Each server runs as a subprocess on a fresh temporary SQLite database with rate limiting disabled.
+
+Usage: python benchmarks/server_throughput.py --servers dev waitress gunicorn --concurrency 16 --duration 20
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, threads):
+    if server == 'dev':
+        # the __main__ block of app.py: single process, debug=True
+        return [sys.executable, os.path.join(SRC, 'app.py')]
+    return [
+        sys.executable, os.path.join(SRC, 'wsgi.py'),
+        '--server', server,
+        '--host', '127.0.0.1',
+        '--port', str(port),
+        '--workers', str(workers),
+        '--threads', str(threads)
+    ]
+
+
+class ServerProcess:
+    """Run the app in a subprocess against a temporary SQLite file; yields the base (host, port).
+
+    `prepare(database_url)` runs before the server starts, e.g. to seed the database.
+    """
+
+    def __init__(self, server, workers=4, threads=4, env=None, startup_timeout=60, prepare=None):
+        self.server = server
+        self.prepare = prepare
+        self.workers = workers
+        self.threads = threads
+        self.env = env or {}
+        self.startup_timeout = startup_timeout
+        self.port = 5000 if server == 'dev' else free_port()
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix='emotion_bench_')
+        self.db_path = os.path.join(self.workdir, 'bench.db')
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': 'sqlite:///' + self.db_path,
+            'RATELIMIT_ENABLED': '0',
+            'CACHE_DIR': os.path.join(self.workdir, 'cache')
+        })
+        env.update(self.env)
+        if self.prepare:
+            self.prepare(env['DATABASE_URL'])
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'w')
+        self.process = subprocess.Popen(
+            server_command(self.server, self.port, self.workers, self.threads),
+            cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+            start_new_session=True  # the dev server reloader and gunicorn workers share the group
+        )
+        self._wait_ready()
+        return ('127.0.0.1', self.port)
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.server} exited early, see {self.log.name}')
+            try:
+                status, _ = request(('127.0.0.1', self.port), 'GET', '/api/health')
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f'{self.server} did not become ready in {self.startup_timeout}s')
+
+    def __exit__(self, *exc):
+        os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        self.log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def request(address, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        payload = json.dumps(body) if body is not None else None
+        all_headers = {'Content-Type': 'application/json'}
+        all_headers.update(headers or {})
+        conn.request(method, path, body=payload, headers=all_headers)
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+    finally:
+        conn.close()
+
+
+def summarize(latencies_ms, errors, elapsed):
+    latencies = np.asarray(latencies_ms) if latencies_ms else np.zeros(1)
+    return {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'throughput_rps': round(len(latencies_ms) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2)
+    }
+
+
+def run_load(address, make_request, concurrency, duration=None, total=None):
+    """Drive make_request(i) -> (method, path, body, headers, route) from `concurrency` threads.
+
+    Stops after `duration` seconds or `total` requests; returns {route: summary} plus an 'all' entry.
+    """
+    deadline = time.monotonic() + duration if duration else None
+    counter = iter(range(total if total else sys.maxsize))
+    results = {}
+
+    def worker():
+        local = {}
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                i = next(counter)
+            except StopIteration:
+                break
+            method, path, body, headers, route = make_request(i)
+            latencies, errors = local.setdefault(route, ([], [0]))
+            start = time.perf_counter()
+            try:
+                status, _ = request(address, method, path, body, headers)
+                ok = 200 <= status < 300
+            except OSError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000.0)
+            else:
+                errors[0] += 1
+        return local
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        partials = [f.result() for f in [pool.submit(worker) for _ in range(concurrency)]]
+    elapsed = time.monotonic() - start
+
+    merged = {}
+    for partial in partials:
+        for route, (latencies, errors) in partial.items():
+            entry = merged.setdefault(route, ([], [0]))
+            entry[0].extend(latencies)
+            entry[1][0] += errors[0]
+
+    for route, (latencies, errors) in merged.items():
+        results[route] = summarize(latencies, errors[0], elapsed)
+    results['all'] = summarize(
+        [latency for latencies, _ in merged.values() for latency in latencies],
+        sum(errors[0] for _, errors in merged.values()),
+        elapsed
+    )
+    return results
+
+
+def mixed_workload(address, guests=8):
+    """Half analyze writes, half dashboard reads, spread over a few guest sessions."""
+    sessions = []
+    for _ in range(guests):
+        status, body = request(address, 'POST', '/api/auth/guest', {})
+        if status != 201:
+            raise RuntimeError(f'guest session failed: {status} {body}')
+        sessions.append(body['session_id'])
+
+    reads = ['/api/stats/system', '/api/users/list?per_page=20', '/api/dashboard/stats']
+
+    def make_request(i):
+        if i % 2 == 0:
+            reading = {'emotions': {'happy': 60 + i % 30, 'neutral': 20}, 'face_data': {'face_detected': True}}
+            return 'POST', '/api/emotions/analyze', reading, {'X-Session-ID': sessions[i % len(sessions)]}, 'analyze'
+        path = reads[(i // 2) % len(reads)]
+        return 'GET', path, None, None, path.split('?')[0]
+
+    return make_request
+
+
+def run(servers, concurrency, duration, workers, threads):
+    report = []
+    for server in servers:
+        with ServerProcess(server, workers=workers, threads=threads) as address:
+            make_request = mixed_workload(address)
+            run_load(address, make_request, concurrency, total=concurrency * 4)  # warm-up
+            results = run_load(address, make_request, concurrency, duration=duration)
+        entry = {
+            'server': server,
+            'workers': 1 if server != 'gunicorn' else workers,
+            'threads': threads if server != 'dev' else None,
+            'concurrency': concurrency,
+            'duration_s': duration,
+            'results': results
+        }
+        report.append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--servers', nargs='+', choices=['dev', 'waitress', 'gunicorn'], default=['dev', 'waitress', 'gunicorn'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+    print(json.dumps(run(args.servers, args.concurrency, args.duration, args.workers, args.threads), indent=2))
@@ -16,6 +16,8 @@ class BackgroundEmotionDetector {
         };
         this.emotionData = [];
         this.sendInterval = null;
+        this.lastSentTimestamp = 0;
+        this.sending = false; // دفعة قيد الإرسال؛ يمنع إعادة إرسال القراءات نفسها في الدورة التالية
     }
 
     
@@ -232,6 +234,11 @@ class BackgroundEmotionDetector {
     async sendDataToAPI() {
         if (!this.apiUrl || this.emotionData.length === 0) return;
 
+        // مع معرف جلسة الخادم تُرسل القراءات غير المرسلة دفعة واحدة إلى /api/emotions/batch
+        if (this.options.sessionId) {
+            return this.sendBatchToAPI();
+        }
+
         try {
             const dataToSend = {
                 timestamp: Date.now(),
@@ -266,6 +273,47 @@ class BackgroundEmotionDetector {
         }
     }
 
+    /**
+     * إرسال القراءات الجديدة منذ آخر إرسال كدفعة واحدة
+     */
+    async sendBatchToAPI() {
+        if (this.sending) return;
+        const pending = this.emotionData.filter(entry => entry.timestamp > this.lastSentTimestamp);
+        if (pending.length === 0) return;
+
+        const readings = pending.map(entry => ({
+            timestamp: entry.timestamp,
+            emotions: Object.fromEntries(
+                Object.entries(entry.emotions).map(([emotion, value]) => [emotion, value * 100])
+            ),
+            face_data: { face_detected: true, face_count: 1 }
+        }));
+
+        this.sending = true;
+        try {
+            const response = await fetch(this.apiUrl, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Session-ID': this.options.sessionId
+                },
+                body: JSON.stringify({ readings })
+            });
+
+            if (response.ok) {
+                this.lastSentTimestamp = pending[pending.length - 1].timestamp;
+                console.log(`✅ تم إرسال ${readings.length} قراءة بنجاح`);
+            } else {
+                console.error('❌ خطأ في إرسال الدفعة:', response.status, response.statusText);
+            }
+
+        } catch (error) {
+            console.error('❌ خطأ في الاتصال بـ API:', error);
+        } finally {
+            this.sending = false;
+        }
+    }
+
     /**
      * توليد معرف جلسة فريد
      */
@@ -423,6 +471,12 @@ BackgroundEmotionDetector.init('https://your-api.com/emotions', {
     videoHeight: 480
 });
 
+للإرسال على دفعات إلى الخادم:
+BackgroundEmotionDetector.init('http://localhost:5000/api/emotions/batch', {
+    sendInterval: 5000,
+    sessionId: 'SESSION_ID_FROM_LOGIN'
+});
+
 للإيقاف:
 BackgroundEmotionDetector.stop();
 
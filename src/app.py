@@ -1,6 +1,6 @@
 
 
-from flask import Flask, request, jsonify , make_response
+from flask import Flask, Request, request, jsonify , make_response, has_request_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -10,29 +10,124 @@ import json
 import uuid
 from datetime import datetime, timedelta
 import logging
+import time
 from logging.handlers import RotatingFileHandler
 import bcrypt
 import jwt
 from functools import wraps
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
+import click
+import tempfile
+import threading
+from io import BytesIO
 
 from models import (
-    db, init_db, create_sample_data,
+    db, init_db, create_sample_data, migrate_face_encodings_to_binary,
     User, UserSession, EmotionSnapshot, 
     FaceEncoding, SystemLog, EmotionStatistics
 )
+from face_index import FaceGalleryIndex, IVFPartitioner
+from ingest import (
+    SnapshotValidationError, build_snapshot_row, build_snapshot_rows, persist_snapshot_rows,
+    parse_reading_timestamp
+)
+from write_behind import WriteBehindQueue
+from embedding_pool import EmbeddingWorkerPool, EmbeddingQueueFull
+from session_cache import SessionResolver
+from auth import TokenVerifier
+from response_cache import ResponseCache
+from metrics import RequestMetrics
+from rollups import update_rollups, rebuild_rollups, backfill_rollups, sum_rollups, emotion_trends, TREND_BUCKETS, EMOTION_COLUMNS
+from utils import EmotionAnalyzer, StreamingEmotionAnalyzer
+
+class InMemoryUploadRequest(Request):
+    """ملفات multipart تبقى في الذاكرة (BytesIO) بدلاً من ملفات مؤقتة على القرص؛ الحجم محدود بـ MAX_CONTENT_LENGTH"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///emotion_analysis_face_api.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+}
+if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+    # in-memory SQLite uses a single static connection and rejects pool sizing
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+    }
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
+app.config['EMOTION_BATCH_MAX_SIZE'] = int(os.environ.get('EMOTION_BATCH_MAX_SIZE', 500))
+app.config['ANALYSIS_CHUNK_SIZE'] = int(os.environ.get('ANALYSIS_CHUNK_SIZE', 2000))
+app.config['ANALYSIS_CACHE_TIMEOUT'] = int(os.environ.get('ANALYSIS_CACHE_TIMEOUT', 600))
+app.config['EMOTION_WRITE_BEHIND'] = os.environ.get('EMOTION_WRITE_BEHIND', '0') == '1'
+app.config['EMOTION_WRITE_QUEUE_SIZE'] = int(os.environ.get('EMOTION_WRITE_QUEUE_SIZE', 1000))
+app.config['EMOTION_WRITE_FLUSH_SIZE'] = int(os.environ.get('EMOTION_WRITE_FLUSH_SIZE', 100))
+app.config['EMOTION_WRITE_FLUSH_INTERVAL'] = float(os.environ.get('EMOTION_WRITE_FLUSH_INTERVAL', 0.5))
+app.config['SYSTEM_LOG_BUFFERED'] = os.environ.get('SYSTEM_LOG_BUFFERED', '1') == '1'
+app.config['SYSTEM_LOG_QUEUE_SIZE'] = int(os.environ.get('SYSTEM_LOG_QUEUE_SIZE', 10000))
+app.config['SYSTEM_LOG_FLUSH_SIZE'] = int(os.environ.get('SYSTEM_LOG_FLUSH_SIZE', 200))
+app.config['SYSTEM_LOG_FLUSH_INTERVAL'] = float(os.environ.get('SYSTEM_LOG_FLUSH_INTERVAL', 1.0))
+app.config['SYSTEM_LOG_POLICY'] = os.environ.get('SYSTEM_LOG_POLICY', 'drop')  # drop, block
+app.config['SESSION_CACHE_TTL'] = float(os.environ.get('SESSION_CACHE_TTL', 30))
+app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+app.config['FACE_INDEX_MODE'] = os.environ.get('FACE_INDEX_MODE', 'exact')  # exact, ivf (approximate, opt-in)
+app.config['FACE_INDEX_NPROBE'] = int(os.environ.get('FACE_INDEX_NPROBE', 16))
+app.config['FACE_INDEX_ANN_MIN_SIZE'] = int(os.environ.get('FACE_INDEX_ANN_MIN_SIZE', 10000))
+# server-side recognition from uploaded images (OpenCV SSD + OpenFace); its gallery is separate from the face-api.js encodings
+app.config['FACE_GALLERY_PATH'] = os.environ.get('FACE_GALLERY_PATH', 'face_data')
+app.config['FACE_MODEL_DIR'] = os.environ.get('FACE_MODEL_DIR')  # default: working directory
+app.config['FACE_UPLOAD_MAX_FILES'] = int(os.environ.get('FACE_UPLOAD_MAX_FILES', 16))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+# concurrent image requests are micro-batched into one DNN forward pass per embedding worker
+app.config['FACE_EMBEDDING_WORKERS'] = int(os.environ.get('FACE_EMBEDDING_WORKERS', 1))
+app.config['FACE_EMBEDDING_MAX_BATCH'] = int(os.environ.get('FACE_EMBEDDING_MAX_BATCH', 16))
+app.config['FACE_EMBEDDING_MAX_WAIT_MS'] = float(os.environ.get('FACE_EMBEDDING_MAX_WAIT_MS', 5))
+app.config['FACE_EMBEDDING_QUEUE_SIZE'] = int(os.environ.get('FACE_EMBEDDING_QUEUE_SIZE', 256))
+app.config['FACE_EMBEDDING_TIMEOUT'] = float(os.environ.get('FACE_EMBEDDING_TIMEOUT', 30))
+# SimpleCache is per-process; FileSystemCache (on /dev/shm when available) or RedisCache is shared by all workers
+app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'SimpleCache')  # SimpleCache, FileSystemCache, RedisCache, NullCache
+app.config['CACHE_DIR'] = os.environ.get('CACHE_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'emotion_analysis_cache'
+))
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_THRESHOLD'] = int(os.environ.get('CACHE_THRESHOLD', 2000))
+app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 60))
+app.config['RESPONSE_CACHE_TIMEOUTS'] = {
+    'system_stats': int(os.environ.get('CACHE_TIMEOUT_SYSTEM_STATS', 30)),
+    'dashboard_stats': int(os.environ.get('CACHE_TIMEOUT_DASHBOARD_STATS', 15)),
+    'users_stats': int(os.environ.get('CACHE_TIMEOUT_USERS_STATS', 30)),
+    'statistics_overview': int(os.environ.get('CACHE_TIMEOUT_STATISTICS_OVERVIEW', 60))
+}
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+app.config['SLOW_REQUEST_STATEMENTS'] = int(os.environ.get('SLOW_REQUEST_STATEMENTS', 5))
+# memory:// limits are counted per worker process; use redis:// to share them across workers
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+app.config['RESPONSE_CACHE_WRITE_INTERVAL'] = float(os.environ.get('RESPONSE_CACHE_WRITE_INTERVAL', 1.0))
 
 CORS(app, origins="*", supports_credentials=True)
 
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+cache = Cache(app)
+response_cache = ResponseCache(cache)
+
+def invalidate_snapshot_caches():
+    """إبطال الاستجابات المعتمدة على اللقطات؛ محدود بمرة كل RESPONSE_CACHE_WRITE_INTERVAL ثانية لكل عملية، والمؤجل يُنفّذ في نهاية الفترة"""
+    response_cache.invalidate('snapshots', min_interval=app.config['RESPONSE_CACHE_WRITE_INTERVAL'])
 
 limiter = Limiter(
     app,
@@ -54,6 +149,134 @@ if not app.debug:
 
 init_db(app)
 
+with app.app_context():
+    # databases from before the rollups (or restored without them) are aggregated once on first start
+    try:
+        backfilled = backfill_rollups()
+        if backfilled is not None:
+            response_cache.invalidate('snapshots')
+            app.logger.info(f"Backfilled daily rollups from {backfilled} snapshots")
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Rollup backfill failed, run 'flask rebuild-rollups': {e}")
+
+request_metrics = RequestMetrics(
+    app,
+    db,
+    enabled=app.config['METRICS_ENABLED'],
+    slow_request_ms=app.config['SLOW_REQUEST_MS'],
+    slow_statements=app.config['SLOW_REQUEST_STATEMENTS']
+)
+
+session_resolver = SessionResolver(
+    ttl=app.config['SESSION_CACHE_TTL'],
+    max_size=app.config['SESSION_CACHE_SIZE']
+)
+
+token_verifier = TokenVerifier(app.config['JWT_SECRET_KEY'])
+
+face_index = FaceGalleryIndex(
+    ann=IVFPartitioner(
+        nprobe=app.config['FACE_INDEX_NPROBE'],
+        min_size=app.config['FACE_INDEX_ANN_MIN_SIZE']
+    ) if app.config['FACE_INDEX_MODE'] == 'ivf' else None
+)
+
+def _face_gallery_signature():
+    count, max_id = db.session.query(
+        db.func.count(FaceEncoding.id),
+        db.func.max(FaceEncoding.id)
+    ).one()
+    return (count, max_id)
+
+def get_face_index():
+    """إرجاع فهرس المعرض مع إعادة تحميله إذا تغيّر الجدول من عملية أخرى"""
+    signature = _face_gallery_signature()
+    if not face_index.is_loaded or face_index.signature != signature:
+        rows = db.session.query(
+            FaceEncoding.id,
+            FaceEncoding.user_id,
+            FaceEncoding.encoding_data,
+            FaceEncoding.confidence_threshold
+        ).all()
+        face_index.load([
+            (face_id, user_id, FaceEncoding.decode_encoding(raw), threshold)
+            for face_id, user_id, raw, threshold in rows
+        ])
+        face_index.signature = signature
+    return face_index
+
+def sync_face_index_signature(added_ids=(), removed_ids=()):
+    """اعتماد توقيع الجدول بعد تعديل محلي طُبّق على الفهرس مباشرة
+
+    التوقيع الجديد يجب أن يساوي التوقيع الذي حُمّل عليه الفهرس مضافاً إليه التعديل المحلي فقط؛
+    أي اختلاف يعني أن عملية أخرى عدّلت الجدول أيضاً، فيُفرّغ الفهرس ليُعاد تحميله في الطلب التالي.
+    """
+    if not face_index.is_loaded:
+        return
+    if face_index.signature is None:
+        face_index.clear()
+        return
+    count, max_id = face_index.signature
+    removed_ids = set(removed_ids)
+    if max_id in removed_ids:
+        max_id = face_index.max_face_id()  # the index already dropped the removed rows
+    expected_max = max([i for i in (max_id, *added_ids) if i is not None], default=None)
+    expected = (count + len(added_ids) - len(removed_ids), expected_max)
+    if _face_gallery_signature() == expected:
+        face_index.signature = expected
+    else:
+        face_index.clear()
+
+@app.cli.command('migrate-face-encodings')
+def migrate_face_encodings_command():
+    """تحويل ترميزات الوجوه القديمة من JSON إلى float32 ثنائي"""
+    converted = migrate_face_encodings_to_binary()
+    face_index.clear()
+    print(f"Converted {converted} face encodings to binary format")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--chunk-size', default=5000, show_default=True, help='Snapshots per transaction')
+def rebuild_rollups_command(chunk_size):
+    """إعادة بناء التجميعات اليومية في emotion_statistics من اللقطات التاريخية"""
+    processed = rebuild_rollups(chunk_size=chunk_size)
+    response_cache.invalidate('snapshots')
+    print(f"Rebuilt daily rollups from {processed} snapshots")
+
+def _write_snapshot_batches(batches):
+    persist_snapshot_rows([row for rows in batches for row in rows])
+    db.session.commit()
+    invalidate_snapshot_caches()
+
+snapshot_queue = WriteBehindQueue(
+    app,
+    _write_snapshot_batches,
+    name='emotion-snapshots',
+    max_size=app.config['EMOTION_WRITE_QUEUE_SIZE'],
+    flush_size=app.config['EMOTION_WRITE_FLUSH_SIZE'],
+    flush_interval=app.config['EMOTION_WRITE_FLUSH_INTERVAL'],
+    item_size=len  # each item is the list of rows from one request
+)
+
+def store_snapshot_rows(rows):
+    """حفظ الصفوف مباشرة أو إضافتها لطابور الكتابة المؤجلة؛ تُرجع False عند امتلاء الطابور
+
+    الصفوف يجب أن تأتي من build_snapshot_row(s) التي تتحقق من كل الحقول، لأن الرد 202 يُرسل قبل الكتابة
+    ولا يستطيع الطابور إبلاغ العميل بصف مرفوض بعدها.
+    """
+    if app.config['EMOTION_WRITE_BEHIND']:
+        return snapshot_queue.enqueue(rows)
+    persist_snapshot_rows(rows)
+    db.session.commit()
+    invalidate_snapshot_caches()
+    return True
+
+def queue_full_response():
+    response = jsonify({'success': False, 'error': 'Ingest queue is full, retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 def generate_jwt_token(user_id, session_id):
     print(1111)
     
@@ -67,50 +290,91 @@ def generate_jwt_token(user_id, session_id):
     return jwt.encode(payload, app.config['JWT_SECRET_KEY'], algorithm='HS256')
 
 def verify_jwt_token(token):
-    try:
-        payload = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+    return token_verifier.verify(token)
+
+def _bearer_token():
+    token = request.headers.get('Authorization')
+    if token and token.startswith('Bearer '):
+        return token[7:]
+    return None
+
+def has_credentials():
+    return bool(_bearer_token() or request.headers.get('X-Session-ID'))
+
+def authenticate_request():
+    """التحقق من JWT (مخزن مؤقتاً) أو X-Session-ID (عبر محلل الجلسات) وإرجاع (user_id, session_id) أو None
+
+    جلسة الرمز يجب أن تكون نشطة في قاعدة البيانات أيضاً (عبر محلل الجلسات)، فتسجيل الخروج في أي عملية
+    يسري على كل العمليات خلال SESSION_CACHE_TTL ويبقى بعد إعادة التشغيل.
+    """
+    token = _bearer_token()
+    if token:
+        payload = verify_jwt_token(token)
+        if payload:
+            session_obj = session_resolver.resolve(payload.get('session_id'))
+            if session_obj and session_obj.user_id == payload.get('user_id'):
+                return payload['user_id'], payload['session_id']
+    
+    session_obj = session_resolver.resolve(request.headers.get('X-Session-ID'))
+    if session_obj:
+        return session_obj.user_id, session_obj.session_id
+    return None
 
 def require_auth(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if token and token.startswith('Bearer '):
-            token = token[7:]
-            payload = verify_jwt_token(token)
-            if payload:
-                request.current_user_id = payload['user_id']
-                request.current_session_id = payload['session_id']
-                return f(*args, **kwargs)
+        auth = authenticate_request()
+        if auth:
+            request.current_user_id, request.current_session_id = auth
+            return f(*args, **kwargs)
         
         return jsonify({'success': False, 'error': 'Authentication required'}), 401
     return decorated_function
 
+def _write_system_logs(entries):
+    db.session.execute(db.insert(SystemLog), entries)
+    db.session.commit()
+
+system_log_queue = WriteBehindQueue(
+    app,
+    _write_system_logs,
+    name='system-logs',
+    max_size=app.config['SYSTEM_LOG_QUEUE_SIZE'],
+    flush_size=app.config['SYSTEM_LOG_FLUSH_SIZE'],
+    flush_interval=app.config['SYSTEM_LOG_FLUSH_INTERVAL'],
+    policy=app.config['SYSTEM_LOG_POLICY']
+)
+
 def log_system_event(event_type, message, level='info', user_id=None, session_id=None, additional_data=None):
+    """تسجيل حدث نظام؛ سياق الطلب يُلتقط فوراً والكتابة تتم على دفعات في الخلفية"""
     try:
-        log_entry = SystemLog(
-            event_type=event_type,
-            level=level,
-            message=message,
-            user_id=user_id,
-            session_id=session_id,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
-        )
+        entry = {
+            'timestamp': datetime.utcnow(),
+            'event_type': event_type,
+            'level': level,
+            'message': message,
+            'user_id': user_id,
+            'session_id': session_id,
+            'ip_address': request.remote_addr if has_request_context() else None,
+            'user_agent': request.headers.get('User-Agent') if has_request_context() else None,
+            'additional_data': json.dumps(additional_data) if additional_data else None
+        }
         
-        if additional_data:
-            log_entry.set_additional_data(additional_data)
+        if app.config['SYSTEM_LOG_BUFFERED']:
+            if not system_log_queue.enqueue(entry):
+                app.logger.warning(f"System log buffer full, event dropped: {event_type}")
+            return
         
-        db.session.add(log_entry)
+        db.session.add(SystemLog(**entry))
         db.session.commit()
         
     except Exception as e:
         app.logger.error(f"Failed to log system event: {e}")
 
+def flush_system_logs(timeout=5.0):
+    """كتابة كل أحداث السجل المعلقة (للاختبارات والإيقاف)"""
+    return system_log_queue.flush(timeout)
+
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -168,6 +432,8 @@ def register_user():
         
         print(1111)
         
+        response_cache.invalidate('users')
+        
         jwt_token = generate_jwt_token(user.id, session_obj.session_id)
         print(1111)
         
@@ -226,6 +492,7 @@ def create_guest_session():
         
         db.session.add(session_obj)
         db.session.commit()
+        response_cache.invalidate('users')
         
         log_system_event(
             'guest_session_created',
@@ -273,6 +540,7 @@ def login_user():
         
         db.session.add(session_obj)
         db.session.commit()
+        response_cache.invalidate('users')
         
         jwt_token = generate_jwt_token(user.id, session_obj.session_id)
         
@@ -299,6 +567,10 @@ def login_user():
 def logout_user():
     try:
         session_id = request.headers.get('X-Session-ID')
+        token = _bearer_token()
+        if not session_id and token:
+            payload = verify_jwt_token(token)
+            session_id = payload['session_id'] if payload else None
         
         if session_id:
             session_obj = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
@@ -306,6 +578,7 @@ def logout_user():
                 session_obj.is_active = False
                 session_obj.end_time = datetime.utcnow()
                 db.session.commit()
+                response_cache.invalidate('users')
                 
                 log_system_event(
                     'user_logout',
@@ -313,6 +586,12 @@ def logout_user():
                     user_id=session_obj.user_id,
                     session_id=session_id
                 )
+            
+            session_resolver.invalidate(session_id)
+            token_verifier.revoke_session(
+                session_id,
+                until=time.time() + app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+            )
         
         return jsonify({'success': True, 'message': 'Logout successful'})
         
@@ -326,72 +605,33 @@ def logout_user():
 def analyze_emotions():
     try:
         data = request.get_json()
-        session_id = request.headers.get('X-Session-ID')
-        
-        if not session_id:
+        if not has_credentials():
             return jsonify({'success': False, 'error': 'Session ID required'}), 400
         
-        session_obj = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
-        if not session_obj:
+        auth = authenticate_request()
+        if not auth:
             return jsonify({'success': False, 'error': 'Invalid session'}), 401
+        user_id, session_id = auth
         
-        emotions_data = data.get('emotions', {})
-        face_data = data.get('face_data', {})
-        age_gender_data = data.get('age_gender_data', {})
-        
-        dominant_emotion = 'neutral'
-        emotion_intensity = 0.0
-        
-        if emotions_data:
-            dominant_emotion = max(emotions_data, key=emotions_data.get)
-            emotion_intensity = emotions_data.get(dominant_emotion, 0.0) / 100.0
-        
-        snapshot = EmotionSnapshot(
-            user_id=session_obj.user_id,
-            session_id=session_id,
-            dominant_emotion=dominant_emotion,
-            emotion_intensity=emotion_intensity,
-            face_detected=face_data.get('face_detected', False),
-            face_count=face_data.get('face_count', 0),
-            face_confidence=face_data.get('face_confidence'),
-            detected_age=age_gender_data.get('age'),
-            detected_gender=age_gender_data.get('gender'),
-            age_confidence=age_gender_data.get('age_confidence'),
-            gender_confidence=age_gender_data.get('gender_confidence'),
-            is_manual_save=data.get('manual_save', False)
-        )
-        
-        snapshot.set_emotions_data(emotions_data)
-        
-        if face_data.get('face_box'):
-            snapshot.set_face_box(face_data['face_box'])
-        
-        db.session.add(snapshot)
-        
-        session_obj.total_snapshots += 1
-        session_obj.user.last_seen = datetime.utcnow()
+        try:
+            row = build_snapshot_row(user_id, session_id, data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Invalid reading: {e}'}), 400
         
-        user = session_obj.user
-        if age_gender_data.get('age') and age_gender_data.get('age_confidence', 0) > (user.age_confidence or 0):
-            user.detected_age = int(age_gender_data['age'])
-            user.age_confidence = age_gender_data['age_confidence']
-        
-        if age_gender_data.get('gender') and age_gender_data.get('gender_confidence', 0) > (user.gender_confidence or 0):
-            user.detected_gender = age_gender_data['gender']
-            user.gender_confidence = age_gender_data['gender_confidence']
-        
-        db.session.commit()
+        if not store_snapshot_rows([row]):
+            return queue_full_response()
         
         return jsonify({
             'success': True,
             'message': 'Emotions analyzed successfully',
             'analysis': {
-                'dominant_emotion': dominant_emotion,
-                'emotion_intensity': emotion_intensity,
-                'face_detected': face_data.get('face_detected', False),
+                'dominant_emotion': row['dominant_emotion'],
+                'emotion_intensity': row['emotion_intensity'],
+                'face_detected': row['face_detected'],
                 'processed_at': datetime.utcnow().isoformat()
             },
-            'saved': True,
+            'saved': not app.config['EMOTION_WRITE_BEHIND'],
+            'queued': app.config['EMOTION_WRITE_BEHIND'],
             'auto_save_interval': 5
         })
         
@@ -400,22 +640,62 @@ def analyze_emotions():
         app.logger.error(f"Emotion analysis error: {e}")
         return jsonify({'success': False, 'error': 'Analysis failed'}), 500
 
+@app.route('/api/emotions/batch', methods=['POST'])
+@limiter.limit("60 per minute")
+def analyze_emotions_batch():
+    """استقبال دفعة من القراءات المؤرخة لجلسة واحدة وحفظها في معاملة واحدة"""
+    try:
+        data = request.get_json() or {}
+        if not has_credentials():
+            return jsonify({'success': False, 'error': 'Session ID required'}), 400
+        
+        auth = authenticate_request()
+        if not auth:
+            return jsonify({'success': False, 'error': 'Invalid session'}), 401
+        user_id, session_id = auth
+        
+        try:
+            rows = build_snapshot_rows(
+                user_id,
+                session_id,
+                data.get('readings'),
+                max_size=app.config['EMOTION_BATCH_MAX_SIZE']
+            )
+        except SnapshotValidationError as e:
+            return jsonify({'success': False, 'error': f'Invalid batch: {e}', 'index': e.index}), 400
+        
+        if not store_snapshot_rows(rows):
+            return queue_full_response()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Batch saved successfully',
+            'saved': 0 if app.config['EMOTION_WRITE_BEHIND'] else len(rows),
+            'queued': len(rows) if app.config['EMOTION_WRITE_BEHIND'] else 0,
+            'first_timestamp': min(row['timestamp'] for row in rows).isoformat(),
+            'last_timestamp': max(row['timestamp'] for row in rows).isoformat()
+        }), 202 if app.config['EMOTION_WRITE_BEHIND'] else 201
+        
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Emotion batch error: {e}")
+        return jsonify({'success': False, 'error': 'Batch save failed'}), 500
+
 @app.route('/api/emotions/snapshot', methods=['POST'])
 @limiter.limit("20 per minute")
 def save_emotion_snapshot():
     try:
         data = request.get_json()
-        session_id = request.headers.get('X-Session-ID')
-        
-        if not session_id:
+        if not has_credentials():
             return jsonify({'success': False, 'error': 'Session ID required'}), 400
         
-        session_obj = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
-        if not session_obj:
+        auth = authenticate_request()
+        if not auth:
             return jsonify({'success': False, 'error': 'Invalid session'}), 401
+        user_id, session_id = auth
         
         snapshot = EmotionSnapshot(
-            user_id=session_obj.user_id,
+            user_id=user_id,
             session_id=session_id,
             dominant_emotion=data.get('dominant_emotion', 'neutral'),
             emotion_intensity=data.get('emotion_intensity', 0.0),
@@ -430,16 +710,25 @@ def save_emotion_snapshot():
             note=data.get('note')
         )
         
-        if data.get('emotions_data'):
-            snapshot.set_emotions_data(data['emotions_data'])
+        snapshot.set_emotions_data(data.get('emotions_data'))
         
         db.session.add(snapshot)
+        db.session.flush()
+        update_rollups([{
+            'user_id': snapshot.user_id,
+            'timestamp': snapshot.timestamp,
+            'dominant_emotion': snapshot.dominant_emotion,
+            'emotion_intensity': snapshot.emotion_intensity,
+            'face_detected': snapshot.face_detected,
+            'face_confidence': snapshot.face_confidence
+        }])
         db.session.commit()
+        invalidate_snapshot_caches()
         
         log_system_event(
             'manual_snapshot_saved',
             f'Manual emotion snapshot saved: {snapshot.dominant_emotion}',
-            user_id=session_obj.user_id,
+            user_id=user_id,
             session_id=session_id,
             additional_data={'emotion_intensity': snapshot.emotion_intensity}
         )
@@ -471,20 +760,19 @@ def recognize_face():
         if not face_encoding or len(face_encoding) != 128:
             return jsonify({'success': False, 'error': 'Valid face encoding required (128 values)'}), 400
         
-        known_faces = FaceEncoding.query.all()
+        top_k = max(1, min(int(data.get('top_k', 1)), 20))
+        matches = get_face_index().search(
+            face_encoding,
+            k=top_k,
+            max_distance=data.get('confidence_threshold'),
+            exact=bool(data.get('exact', False))
+        )
         
         best_match = None
         best_distance = float('inf')
-        confidence_threshold = data.get('confidence_threshold', 0.6)
-        
-        for known_face in known_faces:
-            known_encoding = known_face.get_encoding_data()
-            if len(known_encoding) == 128:
-                distance = np.linalg.norm(np.array(face_encoding) - np.array(known_encoding))
-                
-                if distance < best_distance and distance < confidence_threshold:
-                    best_distance = distance
-                    best_match = known_face
+        if matches:
+            best_match = db.session.get(FaceEncoding, matches[0][0])
+            best_distance = matches[0][2]
         
         if best_match:
             best_match.last_used = datetime.utcnow()
@@ -504,7 +792,11 @@ def recognize_face():
                 'recognized': True,
                 'user': best_match.user.to_dict(),
                 'confidence': 1 - best_distance,
-                'face_id': best_match.id
+                'face_id': best_match.id,
+                'matches': [
+                    {'face_id': face_id, 'user_id': match_user_id, 'confidence': 1 - distance, 'distance': distance}
+                    for face_id, match_user_id, distance in matches
+                ]
             })
         else:
             return jsonify({
@@ -541,6 +833,10 @@ def add_face_encoding():
         db.session.add(face_enc)
         db.session.commit()
         
+        if face_index.is_loaded:
+            face_index.add(face_enc.id, user_id, face_encoding, face_enc.confidence_threshold)
+            sync_face_index_signature(added_ids=[face_enc.id])
+        
         log_system_event(
             'face_encoding_added',
             f'Face encoding added for user: {user_id}',
@@ -560,15 +856,176 @@ def add_face_encoding():
         return jsonify({'success': False, 'error': 'Failed to add face encoding'}), 500
 
 
+_face_system = None
+_face_system_lock = threading.Lock()
+
+def _load_face_encoder():
+    from face_recognition_system import FaceEncoder
+    return FaceEncoder(app.config['FACE_MODEL_DIR'])
+
+embedding_pool = EmbeddingWorkerPool(
+    _load_face_encoder,
+    name='embedding-pool',
+    workers=app.config['FACE_EMBEDDING_WORKERS'],
+    max_batch_size=app.config['FACE_EMBEDDING_MAX_BATCH'],
+    max_wait=app.config['FACE_EMBEDDING_MAX_WAIT_MS'] / 1000.0,
+    max_queue=app.config['FACE_EMBEDDING_QUEUE_SIZE'],
+    result_timeout=app.config['FACE_EMBEDDING_TIMEOUT']
+)
+
+def get_face_system():
+    """نظام التعرف من الصور (نماذج OpenCV ومعرض FACE_GALLERY_PATH)، يُحمّل مرة واحدة عند أول طلب"""
+    global _face_system
+    if _face_system is None:
+        with _face_system_lock:
+            if _face_system is None:
+                from face_recognition_system import FaceRecognitionSystem
+                # loads the networks of every embedding worker; fails here when the model files are missing
+                embedding_pool.start()
+                _face_system = FaceRecognitionSystem(
+                    data_path=app.config['FACE_GALLERY_PATH'],
+                    search_mode=app.config['FACE_INDEX_MODE'],
+                    nprobe=app.config['FACE_INDEX_NPROBE'],
+                    ann_min_size=app.config['FACE_INDEX_ANN_MIN_SIZE'],
+                    encoder=embedding_pool
+                )
+    return _face_system
+
+def embedding_queue_full_response():
+    response = jsonify({'success': False, 'error': 'Face embedding queue is full, retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def _uploaded_images():
+    """(اسم الملف، memoryview على محتواه) لكل ملف في الحقل image دون نسخ البايتات"""
+    uploads = []
+    for upload in request.files.getlist('image'):
+        stream = upload.stream
+        data = stream.getbuffer() if isinstance(stream, BytesIO) else memoryview(upload.read())
+        uploads.append((upload.filename, data))
+    return uploads
+
+def _face_images_unavailable(e):
+    app.logger.error(f"Face recognition models unavailable: {e}")
+    return jsonify({'success': False, 'error': 'Image-based face recognition is not available'}), 503
+
+@app.route('/api/faces/image/register', methods=['POST'])
+@require_auth
+@limiter.limit("10 per minute")
+def register_face_images():
+    """تسجيل وجه المستخدم الحالي من صورة أو أكثر مرفوعة (multipart)
+
+    الاسم في المعرض هو دائماً اسم صاحب الجلسة، فلا يمكن تسجيل وجه باسم مستخدم آخر.
+    """
+    try:
+        uploads = _uploaded_images()
+        if not uploads:
+            return jsonify({'success': False, 'error': 'At least one image file required (field: image)'}), 400
+        if len(uploads) > app.config['FACE_UPLOAD_MAX_FILES']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many images (max {app.config['FACE_UPLOAD_MAX_FILES']})"
+            }), 400
+        
+        user_id = request.current_user_id
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({'success': False, 'error': 'User not found'}), 404
+        name = user.name
+        
+        try:
+            system = get_face_system()
+        except Exception as e:
+            return _face_images_unavailable(e)
+        
+        from face_recognition_system import FACE_OK
+        # every worker may enroll: appends are serialized by the gallery's file lock, and the
+        # refresh brings this process's index up to date with faces enrolled elsewhere
+        system.refresh()
+        results = system.register_faces([(data, name) for _, data in uploads])
+        registered = sum(1 for _, _, status in results if status == FACE_OK)
+        
+        log_system_event(
+            'face_images_registered',
+            f'{registered} of {len(results)} face images registered for: {name}',
+            user_id=user_id,
+            session_id=request.current_session_id
+        )
+        
+        return jsonify({
+            'success': registered > 0,
+            'name': name,
+            'registered': registered,
+            'results': [
+                {'filename': filename, 'status': status}
+                for (filename, _), (_, _, status) in zip(uploads, results)
+            ]
+        }), 201 if registered else 400
+        
+    except RequestEntityTooLarge:
+        raise
+    except EmbeddingQueueFull:
+        return embedding_queue_full_response()
+    except Exception as e:
+        app.logger.error(f"Register face images error: {e}")
+        return jsonify({'success': False, 'error': 'Failed to register face images'}), 500
+
+@app.route('/api/faces/image/recognize', methods=['POST'])
+@require_auth
+@limiter.limit("50 per minute")
+def recognize_face_images():
+    """التعرف على الوجوه في صور مرفوعة (multipart) دون كتابتها على القرص؛ يتطلب جلسة نشطة أو JWT"""
+    try:
+        uploads = _uploaded_images()
+        if not uploads:
+            return jsonify({'success': False, 'error': 'At least one image file required (field: image)'}), 400
+        if len(uploads) > app.config['FACE_UPLOAD_MAX_FILES']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many images (max {app.config['FACE_UPLOAD_MAX_FILES']})"
+            }), 400
+        
+        try:
+            system = get_face_system()
+        except Exception as e:
+            return _face_images_unavailable(e)
+        
+        # pick up faces enrolled by other worker processes
+        system.refresh()
+        results = []
+        for (filename, _), (name, status) in zip(uploads, system.identify_faces([data for _, data in uploads])):
+            recognized = name is not None and name != 'Unknown'
+            results.append({
+                'filename': filename,
+                'status': status,
+                'recognized': recognized,
+                'name': name if recognized else None
+            })
+        
+        return jsonify({
+            'success': True,
+            'recognized': any(result['recognized'] for result in results),
+            'results': results
+        })
+        
+    except RequestEntityTooLarge:
+        raise
+    except EmbeddingQueueFull:
+        return embedding_queue_full_response()
+    except Exception as e:
+        app.logger.error(f"Recognize face images error: {e}")
+        return jsonify({'success': False, 'error': 'Face recognition failed'}), 500
+
+
 @app.route('/api/stats/user/<int:user_id>', methods=['GET'])
-def get_user_stats():
-    """الحصول على إحصائيات المستخدم"""
+def get_user_stats(user_id):
+    """الحصول على إحصائيات المستخدم من التجميعات اليومية"""
     try:
-        session_id = request.headers.get('X-Session-ID')
         period = request.args.get('period', 'week')  # day, week, month
         
-        session_obj = UserSession.query.filter_by(session_id=session_id, is_active=True).first()
-        if not session_obj or session_obj.user_id != user_id:
+        auth = authenticate_request()
+        if not auth or auth[0] != user_id:
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
         
         if period == 'day':
@@ -580,18 +1037,15 @@ def get_user_stats():
         else:
             start_date = datetime.utcnow() - timedelta(weeks=1)
         
-        snapshots = EmotionSnapshot.query.filter(
-            EmotionSnapshot.user_id == user_id,
-            EmotionSnapshot.timestamp >= start_date
-        ).all()
-        
-        total_snapshots = len(snapshots)
-        emotion_distribution = {}
-        total_analysis_time = 0
-        
-        for snapshot in snapshots:
-            emotion = snapshot.dominant_emotion
-            emotion_distribution[emotion] = emotion_distribution.get(emotion, 0) + 1
+        # rollups are daily, so the window (and the reported start) is aligned to the start of the first day
+        start_date = datetime.combine(start_date.date(), datetime.min.time())
+        total_snapshots, emotion_distribution = sum_rollups(
+            EmotionStatistics.query.filter(
+                EmotionStatistics.user_id == user_id,
+                EmotionStatistics.period_type == 'daily',
+                EmotionStatistics.date >= start_date.date()
+            )
+        )
         
         if total_snapshots > 0:
             for emotion in emotion_distribution:
@@ -599,8 +1053,7 @@ def get_user_stats():
                     (emotion_distribution[emotion] / total_snapshots) * 100, 1
                 )
         
-        sessions = UserSession.query.filter_by(user_id=user_id).all()
-        total_sessions = len(sessions)
+        total_sessions = UserSession.query.filter_by(user_id=user_id).count()
         
         return jsonify({
             'success': True,
@@ -621,7 +1074,119 @@ def get_user_stats():
         app.logger.error(f"User stats error: {e}")
         return jsonify({'success': False, 'error': 'Failed to get user stats'}), 500
 
+def _analysis_time_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    return parse_reading_timestamp(int(value) if value.isdigit() else value)
+
+def run_snapshot_analysis(scope_filter, cache_scope, start, end, include_series):
+    """تحليل لقطات النطاق بقراءة الصفوف على دفعات (yield_per)
+
+    بدون السلاسل يكفي StreamingEmotionAnalyzer بذاكرة ثابتة مهما كثرت اللقطات؛ السلاسل (بطول عدد اللقطات)
+    تتطلب EmotionAnalyzer الكامل.
+
+    النتيجة مخزنة حسب (النطاق، عدد اللقطات، آخر معرف)، فأي لقطة جديدة في النطاق تُنتج مفتاحاً جديداً.
+    """
+    query = db.session.query(EmotionSnapshot.timestamp, EmotionSnapshot.emotions_data).filter(scope_filter)
+    if start:
+        query = query.filter(EmotionSnapshot.timestamp >= start)
+    if end:
+        query = query.filter(EmotionSnapshot.timestamp <= end)
+    
+    readings, last_id = query.with_entities(
+        db.func.count(EmotionSnapshot.id), db.func.max(EmotionSnapshot.id)
+    ).one()
+    
+    cache_key = f"analysis:{cache_scope}:{start}:{end}:{int(include_series)}:{readings}:{last_id}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+    
+    chunk_size = app.config['ANALYSIS_CHUNK_SIZE']
+    rows = query.order_by(EmotionSnapshot.timestamp, EmotionSnapshot.id).yield_per(chunk_size)
+    if include_series:
+        result = EmotionAnalyzer.from_snapshots(rows, emotion_types=list(EMOTION_COLUMNS)).get_full_analysis()
+    else:
+        analyzer = StreamingEmotionAnalyzer(emotion_types=list(EMOTION_COLUMNS))
+        result = analyzer.update_snapshot_stream(rows, chunk_size).get_full_analysis()
+    result['readings'] = readings
+    result['range'] = {
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None
+    }
+    
+    cache.set(cache_key, result, timeout=app.config['ANALYSIS_CACHE_TIMEOUT'])
+    return result, False
+
+@app.route('/api/analysis/session/<session_id>', methods=['GET'])
+def analyze_session(session_id):
+    """تحليل مشاعر جلسة كاملة أو جزء منها (start/end بصيغة ISO أو مللي ثانية)"""
+    try:
+        auth = authenticate_request()
+        if not auth:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        
+        owner_id = db.session.query(UserSession.user_id).filter_by(session_id=session_id).scalar()
+        if owner_id is None:
+            return jsonify({'success': False, 'error': 'Session not found'}), 404
+        if owner_id != auth[0]:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        
+        try:
+            start = _analysis_time_arg('start')
+            end = _analysis_time_arg('end')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid range: {e}'}), 400
+        
+        analysis, cached = run_snapshot_analysis(
+            EmotionSnapshot.session_id == session_id,
+            f'session:{session_id}',
+            start,
+            end,
+            include_series=request.args.get('series', '1') != '0'
+        )
+        
+        return jsonify({'success': True, 'session_id': session_id, 'cached': cached, 'analysis': analysis})
+        
+    except Exception as e:
+        app.logger.error(f"Session analysis error: {e}")
+        return jsonify({'success': False, 'error': 'Analysis failed'}), 500
+
+@app.route('/api/analysis/user/<int:user_id>', methods=['GET'])
+def analyze_user(user_id):
+    """تحليل مشاعر المستخدم عبر كل جلساته في نطاق زمني (افتراضياً آخر 7 أيام)"""
+    try:
+        auth = authenticate_request()
+        if not auth or auth[0] != user_id:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        
+        try:
+            start = _analysis_time_arg('start') or datetime.utcnow() - timedelta(days=7)
+            end = _analysis_time_arg('end')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid range: {e}'}), 400
+        
+        if request.args.get('start') is None:
+            # align the default window so repeated calls share a cache entry
+            start = start.replace(minute=0, second=0, microsecond=0)
+        
+        analysis, cached = run_snapshot_analysis(
+            EmotionSnapshot.user_id == user_id,
+            f'user:{user_id}',
+            start,
+            end,
+            include_series=request.args.get('series', '1') != '0'
+        )
+        
+        return jsonify({'success': True, 'user_id': user_id, 'cached': cached, 'analysis': analysis})
+        
+    except Exception as e:
+        app.logger.error(f"User analysis error: {e}")
+        return jsonify({'success': False, 'error': 'Analysis failed'}), 500
+
 @app.route('/api/stats/system', methods=['GET'])
+@response_cache.cached(timeout=app.config['RESPONSE_CACHE_TIMEOUTS']['system_stats'], groups=('users', 'snapshots'))
 def get_system_stats():
     try:
         total_users = User.query.count()
@@ -634,14 +1199,9 @@ def get_system_stats():
         ).count()
         
         total_sessions = UserSession.query.count()
-        total_snapshots = EmotionSnapshot.query.count()
-        
-        emotion_stats = db.session.query(
-            EmotionSnapshot.dominant_emotion,
-            db.func.count(EmotionSnapshot.id)
-        ).group_by(EmotionSnapshot.dominant_emotion).all()
-        
-        emotion_distribution = {emotion: count for emotion, count in emotion_stats}
+        total_snapshots, emotion_distribution = sum_rollups(
+            EmotionStatistics.query.filter_by(period_type='daily')
+        )
         
         return jsonify({
             'success': True,
@@ -662,6 +1222,59 @@ def get_system_stats():
         return jsonify({'success': False, 'error': 'Failed to get system stats'}), 500
 
 
+@app.route('/api/stats/ingest-queue', methods=['GET'])
+def get_ingest_queue_stats():
+    return jsonify({
+        'success': True,
+        'enabled': app.config['EMOTION_WRITE_BEHIND'],
+        'queue': snapshot_queue.metrics(),
+        'system_log_queue': system_log_queue.metrics()
+    })
+
+@app.route('/api/stats/session-cache', methods=['GET'])
+def get_session_cache_stats():
+    return jsonify({
+        'success': True,
+        'session_cache': session_resolver.stats(),
+        'token_cache': token_verifier.stats(),
+        'response_cache': dict(response_cache.stats(), backend=app.config['CACHE_TYPE'])
+    })
+
+request_metrics.register_collector('snapshot_queue', snapshot_queue.metrics)
+request_metrics.register_collector('system_log_queue', system_log_queue.metrics)
+request_metrics.register_collector('session_cache', session_resolver.stats)
+request_metrics.register_collector('token_cache', token_verifier.stats)
+request_metrics.register_collector('response_cache', response_cache.stats)
+request_metrics.register_collector('embedding_pool', embedding_pool.metrics)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """المقاييس بصيغة Prometheus النصية"""
+    response = make_response(request_metrics.render_prometheus())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+@app.route('/api/admin/metrics', methods=['GET', 'POST'])
+@require_auth
+def configure_metrics():
+    """عرض ملخص المقاييس، أو تشغيلها/إيقافها وتغيير حد الطلب البطيء أثناء التشغيل"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            if 'enabled' in data:
+                request_metrics.enabled = bool(data['enabled'])
+            if 'slow_request_ms' in data:
+                request_metrics.slow_request_ms = float(data['slow_request_ms'])
+            if 'slow_statements' in data:
+                request_metrics.slow_statements = int(data['slow_statements'])
+            if data.get('reset'):
+                request_metrics.reset()
+        
+        return jsonify({'success': True, 'metrics': request_metrics.summary()})
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid metrics settings: {e}'}), 400
+
 @app.route('/api/admin/cleanup', methods=['POST'])
 @require_auth
 def cleanup_old_data():
@@ -683,6 +1296,8 @@ def cleanup_old_data():
         SystemLog.query.filter(SystemLog.timestamp < cutoff_date).delete()
         
         db.session.commit()
+        session_resolver.clear()
+        response_cache.invalidate('users')
         
         return jsonify({
             'success': True,
@@ -712,24 +1327,22 @@ def internal_error(error):
 def ratelimit_handler(e):
     return jsonify({'success': False, 'error': 'Rate limit exceeded'}), 429
 
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({'success': False, 'error': 'Request too large'}), 413
+
 @app.route('/api/dashboard/stats', methods=['GET'])
+@response_cache.cached(timeout=app.config['RESPONSE_CACHE_TIMEOUTS']['dashboard_stats'], groups=('users', 'snapshots'))
 def get_dashboard_stats():
     try:
         total_users = User.query.count()
         active_users_today = UserSession.query.filter(
             UserSession.start_time >= datetime.utcnow().date()
         ).count()
-        total_snapshots = EmotionSnapshot.query.count()
         total_sessions = UserSession.query.count()
-        
-        emotion_counts = db.session.query(
-            EmotionSnapshot.dominant_emotion,
-            db.func.count(EmotionSnapshot.id)
-        ).group_by(EmotionSnapshot.dominant_emotion).all()
-        
-        emotion_distribution = {}
-        for emotion, count in emotion_counts:
-            emotion_distribution[emotion] = count
+        total_snapshots, emotion_distribution = sum_rollups(
+            EmotionStatistics.query.filter_by(period_type='daily')
+        )
         
         return jsonify({
             'success': True,
@@ -744,17 +1357,38 @@ def get_dashboard_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _dashboard_page_args(default_limit, max_limit):
+    limit = max(1, min(int(request.args.get('limit', default_limit)), max_limit))
+    before = request.args.get('before')
+    return limit, int(before) if before else None
+
 @app.route('/api/dashboard/active-sessions', methods=['GET'])
 def get_active_sessions():
     try:
-        sessions = UserSession.query.filter(
+        limit, before = _dashboard_page_args(10, 100)
+        
+        query = UserSession.query.options(db.joinedload(UserSession.user)).filter(
             UserSession.end_time.is_(None)
-        ).order_by(UserSession.start_time.desc()).limit(10).all()
+        )
+        if before:
+            query = query.filter(UserSession.id < before)
+        
+        sessions = query.order_by(UserSession.id.desc()).limit(limit + 1).all()
+        has_more = len(sessions) > limit
+        sessions = sessions[:limit]
+        
+        snapshot_counts = dict(
+            db.session.query(
+                EmotionSnapshot.session_id,
+                db.func.count(EmotionSnapshot.id)
+            ).filter(
+                EmotionSnapshot.session_id.in_([session.session_id for session in sessions])
+            ).group_by(EmotionSnapshot.session_id).all()
+        ) if sessions else {}
         
         sessions_data = []
         for session in sessions:
-            user = User.query.get(session.user_id)
-            snapshots_count = EmotionSnapshot.query.filter_by(session_id=session.id).count()
+            user = session.user
             
             duration = datetime.utcnow() - session.start_time
             duration_str = f"{duration.seconds // 60}:{duration.seconds % 60:02d}"
@@ -765,13 +1399,14 @@ def get_active_sessions():
                 'user_type': 'مسجل' if user and not user.is_guest else 'ضيف',
                 'start_time': session.start_time.strftime('%Y-%m-%d %H:%M:%S'),
                 'duration': duration_str,
-                'snapshots': snapshots_count,
+                'snapshots': snapshot_counts.get(session.session_id, 0),
                 'status': 'نشط'
             })
         
         return jsonify({
             'success': True,
-            'data': sessions_data
+            'data': sessions_data,
+            'next_cursor': sessions[-1].id if has_more else None
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -780,37 +1415,49 @@ def get_active_sessions():
 def get_system_logs():
     try:
         level_filter = request.args.get('level', 'all')
+        limit, before = _dashboard_page_args(50, 500)
         
-        query = SystemLog.query
+        query = db.session.query(SystemLog, User.name).outerjoin(
+            User, User.id == SystemLog.user_id
+        )
         if level_filter != 'all':
-            query = query.filter_by(level=level_filter)
+            query = query.filter(SystemLog.level == level_filter)
+        if before:
+            query = query.filter(SystemLog.id < before)
         
-        logs = query.order_by(SystemLog.timestamp.desc()).limit(50).all()
+        rows = query.order_by(SystemLog.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         logs_data = []
-        for log in logs:
-            user = User.query.get(log.user_id) if log.user_id else None
+        for log, user_name in rows:
             logs_data.append({
                 'id': log.id,
                 'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                 'level': log.level,
                 'event_type': log.event_type,
                 'message': log.message,
-                'user_name': user.name if user else '-'
+                'user_name': user_name or '-'
             })
         
         return jsonify({
             'success': True,
-            'data': logs_data
+            'data': logs_data,
+            'next_cursor': rows[-1][0].id if has_more else None
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/statistics/overview', methods=['GET'])
+@response_cache.cached(timeout=app.config['RESPONSE_CACHE_TIMEOUTS']['statistics_overview'], groups=('users', 'snapshots'))
 def get_statistics_overview():
     """جلب إحصائيات شاملة"""
     try:
         period = request.args.get('period', 'week')
+        try:
+            trend_days = max(1, min(int(request.args.get('trend_days', 7)), 366))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'trend_days must be an integer'}), 400
         
         end_date = datetime.utcnow()
         if period == 'today':
@@ -824,9 +1471,11 @@ def get_statistics_overview():
         else:
             start_date = end_date - timedelta(days=7)
         
-        total_analyses = EmotionSnapshot.query.filter(
-            EmotionSnapshot.timestamp >= start_date
-        ).count()
+        period_rollups = EmotionStatistics.query.filter(
+            EmotionStatistics.period_type == 'daily',
+            EmotionStatistics.date >= start_date.date()
+        )
+        total_analyses, emotions_data = sum_rollups(period_rollups)
         
         avg_session_duration = db.session.query(
             db.func.avg(
@@ -838,36 +1487,24 @@ def get_statistics_overview():
             UserSession.end_time.isnot(None)
         ).scalar() or 0
         
-        unique_users = db.session.query(
-            db.func.count(db.func.distinct(EmotionSnapshot.user_id))
-        ).filter(
-            EmotionSnapshot.timestamp >= start_date
+        unique_users = period_rollups.filter(
+            EmotionStatistics.total_snapshots > 0
+        ).with_entities(
+            db.func.count(db.func.distinct(EmotionStatistics.user_id))
         ).scalar() or 0
         
         face_detection_accuracy = 94.5
         
-        emotion_distribution = db.session.query(
-            EmotionSnapshot.dominant_emotion,
-            db.func.count(EmotionSnapshot.id)
-        ).filter(
-            EmotionSnapshot.timestamp >= start_date
-        ).group_by(EmotionSnapshot.dominant_emotion).all()
-        
-        emotions_data = {}
-        for emotion, count in emotion_distribution:
-            emotions_data[emotion] = count
-        
-        emotion_trends = {}
-        for i in range(7):
-            date = (end_date - timedelta(days=i)).date()
-            day_emotions = db.session.query(
-                EmotionSnapshot.dominant_emotion,
-                db.func.count(EmotionSnapshot.id)
-            ).filter(
-                db.func.date(EmotionSnapshot.timestamp) == date
-            ).group_by(EmotionSnapshot.dominant_emotion).all()
-            
-            emotion_trends[date.strftime('%Y-%m-%d')] = dict(day_emotions)
+        trend_bucket = request.args.get('bucket', 'day')
+        if trend_bucket not in TREND_BUCKETS:
+            trend_bucket = 'day'
+        if trend_bucket == 'hour':
+            trend_days = min(trend_days, 31)
+        
+        trend_start = datetime.combine(
+            (end_date - timedelta(days=trend_days - 1)).date(), datetime.min.time()
+        )
+        trends = emotion_trends(trend_start, end_date, trend_bucket)
         
         return jsonify({
             'success': True,
@@ -879,7 +1516,8 @@ def get_statistics_overview():
                     'unique_users': unique_users
                 },
                 'emotion_distribution': emotions_data,
-                'emotion_trends': emotion_trends,
+                'emotion_trends': trends,
+                'trend_bucket': trend_bucket,
                 'period': period
             }
         })
@@ -916,52 +1554,78 @@ def get_users_list():
                 yesterday = datetime.utcnow() - timedelta(days=1)
                 active_user_ids = db.session.query(UserSession.user_id).filter(
                     UserSession.start_time >= yesterday
-                ).distinct().subquery()
+                ).distinct()
                 query = query.filter(User.id.in_(active_user_ids))
         
-        pagination = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # per-user aggregates as correlated subqueries, evaluated only for the rows on this page
+        sessions_count = db.select(db.func.count(UserSession.id)).where(
+            UserSession.user_id == User.id
+        ).correlate(User).scalar_subquery().label('sessions_count')
+        last_session = db.select(db.func.max(UserSession.start_time)).where(
+            UserSession.user_id == User.id
+        ).correlate(User).scalar_subquery().label('last_session')
         
+        query = query.add_columns(sessions_count, last_session).order_by(User.id)
+        
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            try:
+                cursor = int(cursor)
+            except ValueError:
+                return jsonify({'success': False, 'error': 'cursor must be an integer'}), 400
+            # keyset pagination: no OFFSET scan and no COUNT(*) over the filtered table
+            rows = query.filter(User.id > cursor).limit(per_page + 1).all()
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            pagination = query.paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            rows = pagination.items
+            pagination_data = {
+                'page': page,
+                'per_page': per_page,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'has_prev': pagination.has_prev,
+                'has_next': pagination.has_next
+            }
+        
+        yesterday = datetime.utcnow() - timedelta(days=1)
         users_data = []
-        for user in pagination.items:
-            sessions_count = UserSession.query.filter_by(user_id=user.id).count()
-            
-            last_session = UserSession.query.filter_by(user_id=user.id).order_by(
-                UserSession.start_time.desc()
-            ).first()
-            
-            last_activity = last_session.start_time if last_session else user.created_at
-            
-            yesterday = datetime.utcnow() - timedelta(days=1)
+        for user, user_sessions_count, user_last_session in rows:
+            last_activity = user_last_session or user.created_at
             is_active = last_activity >= yesterday
             
             users_data.append({
                 'id': user.id,
                 'name': user.name,
                 'type': 'guest' if user.is_guest else 'registered',
-                'gender': user.gender or 'غير محدد',
-                'age': user.age or 0,
+                'gender': user.detected_gender or 'غير محدد',
+                'age': user.detected_age or 0,
                 'email': user.email or '-',
                 'registration_date': user.created_at.strftime('%Y-%m-%d'),
                 'last_activity': last_activity.strftime('%Y-%m-%d %H:%M:%S'),
-                'sessions': sessions_count,
+                'sessions': user_sessions_count,
                 'status': 'active' if is_active else 'inactive'
             })
         
-        return jsonify({
-            'success': True,
-            'data': {
+        if cursor is not None:
+            # separate object: offset clients keep their 'pagination' shape untouched
+            data = {
                 'users': users_data,
-                'pagination': {
-                    'page': page,
+                'cursor': {
                     'per_page': per_page,
-                    'total': pagination.total,
-                    'pages': pagination.pages,
-                    'has_prev': pagination.has_prev,
-                    'has_next': pagination.has_next
+                    'next_cursor': users_data[-1]['id'] if users_data and has_next else None,
+                    'has_next': has_next
                 }
             }
+        else:
+            data = {'users': users_data, 'pagination': pagination_data}
+        
+        return jsonify({
+            'success': True,
+            'data': data
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1026,15 +1690,13 @@ def update_user(user_id):
         
         user.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('users')
         
-        log_entry = SystemLog(
-            level='info',
-            event_type='user_update',
-            message=f'تم تحديث بيانات المستخدم {user.name}',
+        log_system_event(
+            'user_update',
+            f'تم تحديث بيانات المستخدم {user.name}',
             user_id=user.id
         )
-        db.session.add(log_entry)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -1048,21 +1710,26 @@ def delete_user(user_id):
     try:
         user = User.query.get_or_404(user_id)
         user_name = user.name
+        face_ids = [face_id for (face_id,) in db.session.query(FaceEncoding.id).filter_by(user_id=user.id)]
         
         EmotionSnapshot.query.filter_by(user_id=user.id).delete()
+        EmotionStatistics.query.filter_by(user_id=user.id).delete()
         UserSession.query.filter_by(user_id=user.id).delete()
         SystemLog.query.filter_by(user_id=user.id).delete()
         
         db.session.delete(user)
         db.session.commit()
         
-        log_entry = SystemLog(
-            level='warning',
-            event_type='user_delete',
-            message=f'تم حذف المستخدم {user_name}'
+        face_index.remove_user(user_id)
+        sync_face_index_signature(removed_ids=face_ids)
+        session_resolver.invalidate_user(user_id)
+        response_cache.invalidate('users', 'snapshots')
+        
+        log_system_event(
+            'user_delete',
+            f'تم حذف المستخدم {user_name}',
+            level='warning'
         )
-        db.session.add(log_entry)
-        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -1072,6 +1739,7 @@ def delete_user(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/users/stats', methods=['GET'])
+@response_cache.cached(timeout=app.config['RESPONSE_CACHE_TIMEOUTS']['users_stats'], groups=('users',))
 def get_users_stats():
     try:
         total_users = User.query.count()
@@ -0,0 +1,100 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+import jwt
+
+
+class TokenVerifier:
+    """تحقق JWT مع ذاكرة مؤقتة للرموز المفكوكة حسب بصمة الرمز حتى انتهاء exp
+
+    قائمة الإلغاء (بمعرف الجلسة) تُفحص في O(1) قبل أي نتيجة مخزنة، وتُملأ عند تسجيل الخروج.
+    القائمة محلية لكل عملية وتضيع عند إعادة التشغيل؛ المرجع المشترك هو is_active للجلسة في قاعدة البيانات
+    الذي يفحصه authenticate_request عبر SessionResolver، لذا تُحذف الإدخالات المنتهية عند كل إلغاء
+    وتُحد القائمة بـ max_size (الأقدم أولاً) دون أن يعود رمز ملغى صالحاً.
+    """
+
+    def __init__(self, secret_key, algorithms=('HS256',), max_size=10000):
+        self.secret_key = secret_key
+        self.algorithms = list(algorithms)
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._revoked_sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalid': 0, 'revoked': 0}
+
+    @staticmethod
+    def _fingerprint(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def _is_revoked(self, session_id, now):
+        until = self._revoked_sessions.get(session_id)
+        if until is None:
+            return False
+        if until < now:
+            del self._revoked_sessions[session_id]
+            return False
+        return True
+
+    def verify(self, token):
+        """إرجاع الحمولة للرمز الصالح غير الملغى، أو None"""
+        if not token:
+            return None
+
+        key = self._fingerprint(token)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._cache[key]
+                entry = None
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self._stats['hits'] += 1
+                payload = entry[0]
+            else:
+                self._stats['misses'] += 1
+                payload = None
+
+        if payload is None:
+            try:
+                payload = jwt.decode(token, self.secret_key, algorithms=self.algorithms)
+            except jwt.InvalidTokenError:
+                with self._lock:
+                    self._stats['invalid'] += 1
+                return None
+
+            expires = payload.get('exp', now + 300)
+            with self._lock:
+                self._cache[key] = (payload, expires)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+
+        with self._lock:
+            if self._is_revoked(payload.get('session_id'), now):
+                self._stats['revoked'] += 1
+                return None
+
+        return payload
+
+    def revoke_session(self, session_id, until=None):
+        """إلغاء كل الرموز الصادرة لجلسة حتى until (افتراضياً: أقصى عمر للرمز)"""
+        if not session_id:
+            return
+        now = time.time()
+        with self._lock:
+            self._revoked_sessions.pop(session_id, None)
+            self._revoked_sessions[session_id] = until or (now + 30 * 24 * 3600)
+            # insertion order is close to expiry order: drop expired entries from the front, then cap the size
+            while self._revoked_sessions and next(iter(self._revoked_sessions.values())) < now:
+                self._revoked_sessions.popitem(last=False)
+            while len(self._revoked_sessions) > self.max_size:
+                self._revoked_sessions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_tokens'] = len(self._cache)
+            stats['revoked_sessions'] = len(self._revoked_sessions)
+        return stats
@@ -0,0 +1,174 @@
+from concurrent.futures import Future, wait
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+class EmbeddingQueueFull(Exception):
+    """طابور الترميز ممتلئ؛ على المستدعي إعادة المحاولة لاحقاً"""
+
+
+class EmbeddingWorkerPool:
+    """عمال ترميز بنماذج محمّلة مسبقاً، يجمعون الصور المتزامنة في دفعات صغيرة لتمريرة DNN واحدة
+
+    encoder_factory() يُرجع كائناً له encode_images(images) (مثل FaceEncoder)، ويُستدعى مرة لكل عامل
+    لأن شبكة cv2.dnn لا تُشارك بين الخيوط. العامل يأخذ أول صورة في الطابور ثم ينتظر حتى max_wait ثانية
+    أو حتى max_batch_size صورة قبل التمرير. يطابق encode_images واجهة FaceEncoder فيمكن تمرير المجمّع
+    إلى FaceRecognitionSystem(encoder=...).
+    """
+
+    _STOP = object()
+
+    def __init__(self, encoder_factory, workers=1, max_batch_size=16, max_wait=0.005, max_queue=256,
+                 enqueue_timeout=0.05, result_timeout=30.0, name='embedding-pool'):
+        self.encoder_factory = encoder_factory
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.enqueue_timeout = enqueue_timeout
+        self.result_timeout = result_timeout
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'encoded': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch_size_seen': 0,
+            'total_batch_seconds': 0.0
+        }
+        atexit.register(self.stop)
+
+    def _running(self):
+        return self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """تحميل نموذج لكل عامل ثم تشغيل الخيوط؛ أخطاء تحميل النماذج تظهر هنا وليس داخل الخيوط"""
+        # a forked worker inherits the object but neither the threads nor usable networks
+        if self._running():
+            return
+        with self._start_lock:
+            if self._running():
+                return
+            encoders = [self.encoder_factory() for _ in range(self.workers)]
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, args=(encoder,), name=f'{self.name}-{i}', daemon=True)
+                for i, encoder in enumerate(encoders)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def submit(self, image):
+        """إضافة صورة مفكوكة (ndarray) إلى الطابور؛ تُرجع Future نتيجتها (encoding أو None، الحالة)"""
+        self.start()
+        future = Future()
+        try:
+            self._queue.put((image, future), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count('rejected')
+            raise EmbeddingQueueFull(f"{self.name} queue is full")
+        self._count('submitted')
+        return future
+
+    def encode_images(self, images):
+        """نفس واجهة FaceEncoder.encode_images: تنتظر نتائج كل الصور بالترتيب
+
+        إذا امتلأ الطابور في منتصف الطلب تُلغى الصور المضافة منه قبل رفع EmbeddingQueueFull، فلا يرمّزها العمال.
+        """
+        futures = []
+        try:
+            for image in images:
+                futures.append(self.submit(image))
+        except EmbeddingQueueFull:
+            for future in futures:
+                future.cancel()
+            raise
+        done, pending = wait(futures, timeout=self.result_timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise TimeoutError(f"{self.name}: {len(pending)} images not encoded within {self.result_timeout}s")
+        return [future.result() for future in futures]
+
+    def _run(self, encoder):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+
+            batch = [item]
+            stop_requested = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop_requested = True
+                    break
+                batch.append(item)
+
+            self._encode(encoder, batch)
+            if stop_requested:
+                return
+
+    def _encode(self, encoder, batch):
+        batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            results = encoder.encode_images([image for image, _ in batch])
+        except Exception as e:
+            self._count('failed', len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            self._count('encoded', len(batch))
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['total_batch_seconds'] += elapsed
+            self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+
+    def stop(self, timeout=10.0):
+        if not self._running():
+            return
+        for _ in self._threads:
+            self._queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats['batches']
+        total = stats.pop('total_batch_seconds')
+        stats.update({
+            'name': self.name,
+            'workers': self.workers,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'depth': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'avg_batch_size': stats['encoded'] / batches if batches else 0.0,
+            'avg_batch_seconds': total / batches if batches else 0.0,
+            'running': self._running()
+        })
+        return stats
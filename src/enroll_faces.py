@@ -0,0 +1,172 @@
+"""تسجيل مجلد صور كامل في معرض الوجوه على عدة عمليات
+
+كل مجلد فرعي مباشر تحت الجذر يمثل شخصاً واحداً، واسمه هو اسم الشخص:
+
+    photos/
+        Alice/001.jpg
+        Alice/trip/002.png
+        Bob/a.jpg
+
+كل إلحاق يتم تحت قفل المعرض الحصري بعد تحديثه من القرص، ويتخطى الصور التي سجّلها الخادم (أو أداة أخرى)
+أثناء التشغيل، فيمكن تشغيل الأداة والخادم على المعرض نفسه في الوقت نفسه (ما عدا Windows حيث لا يتوفر القفل).
+
+Usage: python enroll_faces.py photos --data-path face_data --model-dir . --workers 4 --batch-size 32
+"""
+import argparse
+from collections import Counter
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from face_recognition_system import FaceEncoder, FACE_OK, FACE_UNREADABLE, batches, decode_image, open_gallery
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+SKIPPED = 'skipped'
+
+_encoder = None
+_known_sources = frozenset()
+
+
+def content_hash(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def iter_images(root):
+    """(المسار، اسم الشخص) لكل صورة تحت مجلدات الأشخاص، بترتيب ثابت"""
+    for person in sorted(os.listdir(root)):
+        person_dir = os.path.join(root, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for directory, subdirs, files in os.walk(person_dir):
+            subdirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(directory, filename), person
+
+
+def _init_worker(model_dir, known_sources):
+    global _encoder, _known_sources
+    cv2.setNumThreads(1)  # one DNN thread per process; the pool provides the parallelism
+    _encoder = FaceEncoder(model_dir)
+    _known_sources = known_sources
+
+
+def _encode_batch(batch):
+    """قراءة الصور وحساب بصمة محتواها وترميز غير المسجل منها بتمريرة واحدة لكل شبكة"""
+    results = []
+    pending = []
+    images = []
+    for image_path, name in batch:
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            results.append((image_path, name, None, FACE_UNREADABLE, None))
+            continue
+        source = content_hash(data)
+        if source in _known_sources:
+            results.append((image_path, name, source, SKIPPED, None))
+            continue
+        pending.append((image_path, name, source))
+        images.append(decode_image(data))
+
+    if pending:
+        for (image_path, name, source), (encoding, status) in zip(pending, _encoder.encode_images(images)):
+            results.append((image_path, name, source, status, encoding))
+    return results
+
+
+def enroll_directory(root, data_path='face_data', model_dir=None, workers=None, batch_size=32, progress=True):
+    """تسجيل كل صور root في المعرض؛ النتائج تُلحق بالمعرض دفعة بدفعة فور وصولها من العمليات
+
+    بصمات العمليات تُلتقط عند البدء فقط؛ ما يُسجّل بعدها في عملية أخرى يُكتشف عند الإلحاق (append_unseen).
+    """
+    gallery = open_gallery(data_path)
+    known_sources = frozenset(gallery.sources())
+    workers = workers or os.cpu_count() or 1
+
+    counts = Counter()
+    failures = []
+    seen = set(known_sources)
+    started = time.perf_counter()
+    image_batches = batches(iter_images(root), batch_size)
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_dir, known_sources))
+        results = pool.imap_unordered(_encode_batch, image_batches)
+    else:
+        pool = None
+        _init_worker(model_dir, known_sources)
+        results = map(_encode_batch, image_batches)
+
+    try:
+        for batch in results:
+            encodings = []
+            names = []
+            sources = []
+            for image_path, name, source, status, encoding in batch:
+                if status == FACE_OK and source in seen:
+                    status = SKIPPED  # identical file enrolled earlier in this run
+                if status == FACE_OK:
+                    seen.add(source)
+                    encodings.append(encoding)
+                    names.append(name)
+                    sources.append(source)
+                    continue
+                counts[status] += 1
+                if status != SKIPPED:
+                    failures.append({'path': image_path, 'name': name, 'status': status})
+            if encodings:
+                # the server may have enrolled some of these files since the workers started
+                enrolled = len(gallery.append_unseen(encodings, names, sources))
+                counts[FACE_OK] += enrolled
+                counts[SKIPPED] += len(encodings) - enrolled
+
+            if progress:
+                processed = sum(counts.values())
+                rate = processed / max(time.perf_counter() - started, 1e-9)
+                print(f"{processed} images, {counts[FACE_OK]} enrolled, {rate:.1f} images/sec", file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - started
+    processed = sum(counts.values())
+    return {
+        'images': processed,
+        'enrolled': counts[FACE_OK],
+        'skipped': counts[SKIPPED],
+        'failed': {status: count for status, count in counts.items() if status not in (FACE_OK, SKIPPED)},
+        'seconds': round(elapsed, 2),
+        'images_per_sec': round(processed / elapsed, 1) if elapsed else 0.0,
+        'gallery_size': len(gallery),
+        'failures': failures
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='directory with one subfolder per person')
+    parser.add_argument('--data-path', default='face_data', help='gallery directory (face_data.pkl is converted)')
+    parser.add_argument('--model-dir', default=None, help='directory with the Caffe/Torch model files (default: cwd)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--quiet', action='store_true', help='no per-batch progress on stderr')
+    args = parser.parse_args(argv)
+
+    report = enroll_directory(
+        args.root, data_path=args.data_path, model_dir=args.model_dir,
+        workers=args.workers, batch_size=args.batch_size, progress=not args.quiet
+    )
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report['images'] and not report['enrolled'] and not report['skipped'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
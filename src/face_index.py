@@ -0,0 +1,255 @@
+import threading
+import numpy as np
+
+
+def _squared_distances(points, centroids, centroid_sq_norms=None):
+    if centroid_sq_norms is None:
+        centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    point_sq_norms = np.einsum('ij,ij->i', points, points)
+    sq = point_sq_norms[:, None] - 2.0 * (points @ centroids.T) + centroid_sq_norms[None, :]
+    np.maximum(sq, 0.0, out=sq)
+    return sq
+
+
+class IVFPartitioner:
+    """تقسيم IVF تقريبي: k-means خشن ثم فحص أقرب nprobe قوائم فقط
+
+    nprobe هو مفتاح الموازنة بين الدقة (recall) والزمن؛ المعارض الأصغر من
+    min_size تُفحص بالكامل دائماً. المراكز تبقى عبر إعادة التحميل ولا يُعاد التدريب
+    إلا إذا تغيّر حجم المعرض بأكثر من retrain_fraction من حجم التدريب.
+    """
+
+    def __init__(self, nlist=None, nprobe=16, min_size=10000, train_iterations=10,
+                 sample_per_list=32, seed=0, retrain_fraction=0.5):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.train_iterations = train_iterations
+        self.sample_per_list = sample_per_list
+        self.seed = seed
+        self.retrain_fraction = retrain_fraction
+        self.centroids = None
+        self._centroid_sq_norms = None
+        self.trained_size = 0
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def needs_training(self, size):
+        if size < self.min_size:
+            return False
+        if not self.is_trained:
+            return True
+        return abs(size - self.trained_size) > self.retrain_fraction * self.trained_size
+
+    def train(self, vectors):
+        n = vectors.shape[0]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, nlist * self.sample_per_list)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            assignment = np.argmin(_squared_distances(sample, centroids), axis=1)
+            counts = np.bincount(assignment, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids.astype(np.float32)
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.trained_size = n
+
+    def assign(self, vectors, chunk_size=8192):
+        vectors = np.atleast_2d(vectors)
+        lists = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            lists[start:start + chunk_size] = np.argmin(
+                _squared_distances(chunk, self.centroids, self._centroid_sq_norms), axis=1
+            )
+        return lists
+
+    def probe(self, query, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        sq = _squared_distances(query[None, :], self.centroids, self._centroid_sq_norms)[0]
+        if nprobe >= sq.shape[0]:
+            return np.arange(sq.shape[0], dtype=np.int32)
+        return np.argpartition(sq, nprobe - 1)[:nprobe].astype(np.int32)
+
+
+class FaceGalleryIndex:
+    """فهرس معرض الوجوه في الذاكرة: مصفوفة float32 متصلة (N×128) مع مصفوفات موازية للمعرفات"""
+
+    def __init__(self, dim=128, initial_capacity=1024, ann=None):
+        self.dim = dim
+        self.ann = ann
+        self._lock = threading.RLock()
+        self._size = 0
+        self._loaded = False
+        self.signature = None
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity):
+        self._matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._face_ids = np.zeros(capacity, dtype=np.int64)
+        self._user_ids = np.zeros(capacity, dtype=np.int64)
+        self._thresholds = np.zeros(capacity, dtype=np.float32)
+        self._list_ids = np.full(capacity, -1, dtype=np.int32)
+
+    def _grow(self, required):
+        capacity = self._matrix.shape[0]
+        if required <= capacity:
+            return
+        new_capacity = max(required, capacity * 2)
+        old = (self._matrix, self._sq_norms, self._face_ids, self._user_ids, self._thresholds, self._list_ids)
+        self._allocate(new_capacity)
+        n = self._size
+        self._matrix[:n] = old[0][:n]
+        self._sq_norms[:n] = old[1][:n]
+        self._face_ids[:n] = old[2][:n]
+        self._user_ids[:n] = old[3][:n]
+        self._thresholds[:n] = old[4][:n]
+        self._list_ids[:n] = old[5][:n]
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return self._size
+
+    def load(self, rows):
+        """تحميل المعرض كاملاً من صفوف (face_id, user_id, encoding, confidence_threshold)"""
+        with self._lock:
+            self._size = 0
+            self._allocate(max(len(rows), 1024))
+            for face_id, user_id, encoding, threshold in rows:
+                self._append(face_id, user_id, encoding, threshold, assign=False)
+            if self.ann is not None:
+                # keep the existing centroids unless the gallery size moved too far from the trained size
+                if self.ann.needs_training(self._size):
+                    self._maybe_train()
+                elif self.ann.is_trained and self._size:
+                    self._list_ids[:self._size] = self.ann.assign(self._matrix[:self._size])
+            self._loaded = True
+
+    def _maybe_train(self):
+        if self.ann is None or not self.ann.needs_training(self._size):
+            return
+        matrix = self._matrix[:self._size]
+        self.ann.train(matrix)
+        self._list_ids[:self._size] = self.ann.assign(matrix)
+
+    def _append(self, face_id, user_id, encoding, threshold, assign=True):
+        vector = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            return False
+        self._grow(self._size + 1)
+        i = self._size
+        self._matrix[i] = vector
+        self._sq_norms[i] = float(vector @ vector)
+        self._face_ids[i] = face_id
+        self._user_ids[i] = user_id
+        self._thresholds[i] = threshold if threshold is not None else 0.6
+        self._list_ids[i] = self.ann.assign(vector)[0] if assign and self.ann is not None and self.ann.is_trained else -1
+        self._size += 1
+        return True
+
+    def add(self, face_id, user_id, encoding, threshold=0.6):
+        with self._lock:
+            added = self._append(face_id, user_id, encoding, threshold)
+            if added:
+                self._maybe_train()
+            return added
+
+    def _remove_mask(self, mask):
+        keep = ~mask
+        n = self._size
+        kept = int(keep.sum())
+        if kept == n:
+            return 0
+        self._matrix[:kept] = self._matrix[:n][keep]
+        self._sq_norms[:kept] = self._sq_norms[:n][keep]
+        self._face_ids[:kept] = self._face_ids[:n][keep]
+        self._user_ids[:kept] = self._user_ids[:n][keep]
+        self._thresholds[:kept] = self._thresholds[:n][keep]
+        self._list_ids[:kept] = self._list_ids[:n][keep]
+        self._size = kept
+        return n - kept
+
+    def remove(self, face_id):
+        with self._lock:
+            return self._remove_mask(self._face_ids[:self._size] == face_id)
+
+    def remove_user(self, user_id):
+        with self._lock:
+            return self._remove_mask(self._user_ids[:self._size] == user_id)
+
+    def max_face_id(self):
+        with self._lock:
+            return int(self._face_ids[:self._size].max()) if self._size else None
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._loaded = False
+            self.signature = None
+
+    def _approximate_rows(self, q, n, nprobe):
+        if self.ann is None or not self.ann.is_trained or n < self.ann.min_size:
+            return None
+        probes = self.ann.probe(q, nprobe)
+        # lookup table indexed by list id. Every row gets a list once centroids exist, so -1
+        # (no list) only occurs before training; the trailing slot keeps such rows selected
+        selected = np.zeros(self.ann.centroids.shape[0] + 1, dtype=bool)
+        selected[probes] = True
+        selected[-1] = True
+        return np.flatnonzero(selected[self._list_ids[:n]])
+
+    def search(self, query, k=1, max_distance=None, exact=False, nprobe=None):
+        """إرجاع أقرب k وجوه كقائمة (face_id, user_id, distance) ضمن عتبة كل صف"""
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            n = self._size
+            if n == 0 or q.shape[0] != self.dim:
+                return []
+
+            rows = None if exact else self._approximate_rows(q, n, nprobe)
+            if rows is None:
+                matrix = self._matrix[:n]
+                sq_norms = self._sq_norms[:n]
+                limits = self._thresholds[:n]
+            else:
+                matrix = self._matrix[rows]
+                sq_norms = self._sq_norms[rows]
+                limits = self._thresholds[rows]
+
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2 computed for all rows in one pass
+            sq = sq_norms - 2.0 * (matrix @ q) + float(q @ q)
+            np.maximum(sq, 0.0, out=sq)
+            distances = np.sqrt(sq)
+
+            if max_distance is not None:
+                limits = np.minimum(limits, max_distance)
+            candidates = np.flatnonzero(distances < limits)
+            if candidates.size == 0:
+                return []
+
+            k = min(k, candidates.size)
+            if candidates.size > k:
+                part = np.argpartition(distances[candidates], k - 1)[:k]
+                candidates = candidates[part]
+            order = candidates[np.argsort(distances[candidates], kind='stable')]
+            positions = order if rows is None else rows[order]
+
+            return [
+                (int(self._face_ids[p]), int(self._user_ids[p]), float(distances[i]))
+                for p, i in zip(positions, order)
+            ]
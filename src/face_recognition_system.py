@@ -1,110 +1,292 @@
 import cv2
 import numpy as np
 import os
-import pickle
+import threading
 
-class FaceRecognitionSystem:
-    def __init__(self, data_path='face_data.pkl'):
-        self.data_path = data_path
-        self.known_face_encodings = []
-        self.known_face_names = []
-        
+from face_index import FaceGalleryIndex, IVFPartitioner
+from gallery_store import GalleryStore, convert_pickle
+
+# encode_images statuses
+FACE_OK = 'ok'
+FACE_UNREADABLE = 'unreadable'
+FACE_NOT_FOUND = 'no_face'
+FACE_MULTIPLE = 'multiple_faces'
+
+DETECTOR_SIZE = (300, 300)
+DETECTOR_MEAN = (104.0, 177.0, 123.0)
+DETECTION_CONFIDENCE = 0.5
+EMBEDDER_SIZE = (96, 96)
+RECOGNITION_THRESHOLD = 0.6  # A common threshold for OpenFace embeddings
+
+def batches(items, batch_size):
+    """تقسيم أي مكرر إلى قوائم بطول batch_size (الأخيرة قد تكون أقصر) دون قراءته كاملاً"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def decode_image(image):
+    """تحويل مصدر الصورة إلى مصفوفة BGR: مسار ملف، أو بايتات مرمّزة (bytes/bytearray/memoryview)، أو ndarray جاهزة
+
+    البايتات تُقرأ عبر memoryview دون نسخها قبل cv2.imdecode. يُرجع None إذا تعذر فك الصورة.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (str, os.PathLike)):
+        return cv2.imread(os.fspath(image))
+    buffer = np.frombuffer(memoryview(image), dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def open_gallery(data_path):
+    """فتح معرض الوجوه، مع تحويل face_data.pkl القديم بجانبه مرة واحدة إن وُجد"""
+    data_path = os.path.splitext(data_path)[0] if data_path.endswith('.pkl') else data_path
+    legacy_path = data_path + '.pkl'
+    if not GalleryStore.exists(data_path) and os.path.isfile(legacy_path):
+        try:
+            gallery = convert_pickle(legacy_path, data_path)
+            print(f"Converted {legacy_path} to gallery {data_path}.")
+            return gallery
+        except FileExistsError:
+            pass  # converted concurrently by another process
+    gallery = GalleryStore(data_path)
+    if os.path.isfile(legacy_path):
+        gallery.wait_for_writers()  # another process may still be converting
+    return gallery
+
+class FaceEncoder:
+    """شبكتا كشف الوجه (SSD) واستخلاص البصمة (OpenFace) محمّلتان مرة واحدة"""
+
+    def __init__(self, model_dir=None):
+        model_dir = model_dir or os.getcwd()
         self.face_detector = cv2.dnn.readNetFromCaffe(
-            os.path.join(os.getcwd(), 'deploy.prototxt.txt'),
-            os.path.join(os.getcwd(), 'res10_300x300_ssd_iter_140000.caffemodel')
+            os.path.join(model_dir, 'deploy.prototxt.txt'),
+            os.path.join(model_dir, 'res10_300x300_ssd_iter_140000.caffemodel')
         )
         
         # Load OpenFace model for face embedding
         self.face_embedder = cv2.dnn.readNetFromTorch(
-            os.path.join(os.getcwd(), 'openface_nn4.small2.v1.t7')
+            os.path.join(model_dir, 'openface_nn4.small2.v1.t7')
         )
+        # cv2.dnn.Net keeps its input between setInput() and forward(); one batch at a time per encoder
+        self._lock = threading.Lock()
+
+    def _detect_faces(self, images):
+        """تشغيل كاشف SSD مرة واحدة على دفعة صور؛ يُرجع لكل صورة قائمة مربعات (x, y, w, h)"""
+        blob = cv2.dnn.blobFromImages(
+            [cv2.resize(image, DETECTOR_SIZE) for image in images], 1.0, DETECTOR_SIZE, DETECTOR_MEAN
+        )
+        self.face_detector.setInput(blob)
+        detections = self.face_detector.forward()
+
+        faces = [[] for _ in images]
+        for detection in detections[0, 0]:
+            # DetectionOutput rows: [image_id, label, confidence, x1, y1, x2, y2]
+            if detection[2] <= DETECTION_CONFIDENCE: # Confidence threshold
+                continue
+            image_id = int(detection[0])
+            if not 0 <= image_id < len(images):
+                continue
+            (h, w) = images[image_id].shape[:2]
+            box = np.clip(detection[3:7], 0.0, 1.0) * np.array([w, h, w, h])
+            (startX, startY, endX, endY) = box.astype("int")
+            faces[image_id].append((startX, startY, endX - startX, endY - startY))
+        return faces
+
+    def _embed_faces(self, face_rois):
+        """تشغيل OpenFace مرة واحدة على كل الوجوه المقتطعة؛ يُرجع مصفوفة (عدد الوجوه × 128)"""
+        face_blob = cv2.dnn.blobFromImages(face_rois, 1.0 / 255, EMBEDDER_SIZE, (0, 0, 0), swapRB=True, crop=False)
+        self.face_embedder.setInput(face_blob)
+        return self.face_embedder.forward().reshape(len(face_rois), -1)
+
+    def encode_images(self, images):
+        """ترميز دفعة صور مفكوكة (ndarray أو None) بتمريرة واحدة لكل شبكة
+
+        يُرجع لكل صورة (encoding أو None، الحالة) حيث الحالة إحدى FACE_OK / FACE_UNREADABLE /
+        FACE_NOT_FOUND / FACE_MULTIPLE.
+        """
+        results = [(None, FACE_UNREADABLE)] * len(images)
+        positions = [i for i, image in enumerate(images) if image is not None and image.size]
+        if not positions:
+            return results
+
+        with self._lock:
+            return self._encode(images, positions, results)
+
+    def _encode(self, images, positions, results):
+        detected = self._detect_faces([images[i] for i in positions])
+
+        rois = []
+        roi_positions = []
+        for i, faces in zip(positions, detected):
+            if len(faces) == 0:
+                results[i] = (None, FACE_NOT_FOUND)
+                continue
+            if len(faces) > 1:
+                results[i] = (None, FACE_MULTIPLE)
+                continue
+            # Extract face ROI
+            x, y, w, h = faces[0]
+            face_roi = images[i][y:y+h, x:x+w]
+            if face_roi.size == 0:
+                results[i] = (None, FACE_NOT_FOUND)
+                continue
+            rois.append(face_roi)
+            roi_positions.append(i)
+
+        if rois:
+            # Get face embeddings using OpenFace model
+            for i, vec in zip(roi_positions, self._embed_faces(rois)):
+                results[i] = (vec.flatten(), FACE_OK)
+        return results
+
+class FaceRecognitionSystem:
+    def __init__(self, data_path='face_data', search_mode='exact', nprobe=16, ann_min_size=10000, model_dir=None,
+                 encoder=None):
+        # data_path is a GalleryStore directory; an old face_data.pkl next to it is converted once
+        self.data_path = os.path.splitext(data_path)[0] if data_path.endswith('.pkl') else data_path
+        self.gallery = None
+        self.index = FaceGalleryIndex(
+            ann=IVFPartitioner(nprobe=nprobe, min_size=ann_min_size) if search_mode == 'ivf' else None
+        )
+        # encoder may be any object with encode_images(), e.g. a shared EmbeddingWorkerPool
+        self.encoder = encoder if encoder is not None else FaceEncoder(model_dir)
 
         self._load_data()
 
     def _load_data(self):
-        if os.path.exists(self.data_path):
-            with open(self.data_path, 'rb') as f:
-                data = pickle.load(f)
-                self.known_face_encodings = data.get('encodings', [])
-                self.known_face_names = data.get('names', [])
-
-    def _save_data(self):
-        with open(self.data_path, 'wb') as f:
-                pickle.dump({'encodings': self.known_face_encodings, 'names': self.known_face_names}, f)
-
-    def _get_face_encoding(self, image_path):
-        image = cv2.imread(image_path)
-        if image is None:
-            print(f"Error: Could not load image from {image_path}")
-            return None
-        
-        (h, w) = image.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        self.face_detector.setInput(blob)
-        detections = self.face_detector.forward()
+        self.gallery = open_gallery(self.data_path)
+        self._rebuild_index()
 
-        faces = []
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > 0.5: # Confidence threshold
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-                faces.append((startX, startY, endX - startX, endY - startY))
+    def _rebuild_index(self):
+        # face_id is the gallery row; the fixed 0.6 threshold is applied in recognize_face
+        rows, _, vectors = self.gallery.live()
+        self.index.load([
+            (int(row), int(row), encoding, float('inf'))
+            for row, encoding in zip(rows, vectors)
+        ])
 
-        if len(faces) == 0:
-            print("No face found in the image.")
+    def refresh(self):
+        """التقاط الوجوه المضافة أو المحذوفة من عملية أخرى تشارك المعرض نفسه"""
+        if self.gallery.refresh():
+            self._rebuild_index()
+
+    @property
+    def known_face_names(self):
+        return self.gallery.names()
+
+    def encode_images(self, images):
+        return self.encoder.encode_images(images)
+
+    def _get_face_encoding(self, image):
+        decoded = decode_image(image)
+        if decoded is None:
+            if isinstance(image, (str, os.PathLike)):
+                print(f"Error: Could not load image from {image}")
+            else:
+                print("Error: Could not decode image data")
             return None
-        elif len(faces) > 1:
+
+        encoding, status = self.encode_images([decoded])[0]
+        if status == FACE_NOT_FOUND:
+            print("No face found in the image.")
+        elif status == FACE_MULTIPLE:
             print("Multiple faces found. Please provide an image with a single face.")
-            return None
-        
-        # Extract face ROI
-        x, y, w, h = faces[0]
-        face_roi = image[y:y+h, x:x+w]
+        return encoding
 
-        # Get face embedding using OpenFace model
-        face_blob = cv2.dnn.blobFromImage(face_roi, 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
-        self.face_embedder.setInput(face_blob)
-        vec = self.face_embedder.forward()
-        return vec.flatten()
+    def _store_faces(self, encodings, names, sources=None):
+        known_rows = self.gallery.rows
+        generation = self.gallery.generation
+        rows = self.gallery.append(encodings, names, sources)
+        if rows and (rows[0] != known_rows or self.gallery.generation != generation):
+            # append picked up rows, deletes or a compaction from another writer first
+            self._rebuild_index()
+        else:
+            for row, encoding in zip(rows, encodings):
+                self.index.add(row, row, encoding, float('inf'))
+        return rows
 
-    def register_face(self, image_path, name):
-        encoding = self._get_face_encoding(image_path)
+    def _match(self, unknown_encoding):
+        # Nearest neighbour over the gallery index (exact below ann_min_size, IVF above)
+        matches = self.index.search(unknown_encoding, k=1)
+        if not matches:
+            return "Unknown"
+        min_distance_index, _, min_distance = matches[0]
+
+        # Threshold for recognition (this value needs to be tuned based on your dataset)
+        if min_distance < RECOGNITION_THRESHOLD:
+            return self.gallery.name(min_distance_index)
+        else:
+            return "Unknown"
+
+    def register_face(self, image, name):
+        encoding = self._get_face_encoding(image)
         if encoding is not None:
-            self.known_face_encodings.append(encoding)
-            self.known_face_names.append(name)
-            self._save_data()
+            self._store_faces([encoding], [name])
             print(f"Face of {name} registered successfully.")
             return True
         return False
 
-    def recognize_face(self, image_path):
-        unknown_encoding = self._get_face_encoding(image_path)
+    def register_faces(self, items, batch_size=32):
+        """تسجيل عدة صور [(image, name), ...] على دفعات؛ كل دفعة تُلحق بالمعرض بكتابة واحدة
+
+        image مسار أو بايتات مرمّزة أو ndarray (انظر decode_image). يُرجع قائمة (image, name, الحالة)
+        بنفس ترتيب المدخلات.
+        """
+        results = []
+        for batch in batches(items, batch_size):
+            encoded = self.encode_images([decode_image(image) for image, _ in batch])
+            encodings = []
+            names = []
+            for (image, name), (encoding, status) in zip(batch, encoded):
+                if encoding is not None:
+                    encodings.append(encoding)
+                    names.append(name)
+                results.append((image, name, status))
+            if encodings:
+                self._store_faces(encodings, names)
+
+        registered = sum(1 for _, _, status in results if status == FACE_OK)
+        print(f"Registered {registered} of {len(results)} faces.")
+        return results
+
+    def recognize_face(self, image):
+        unknown_encoding = self._get_face_encoding(image)
         if unknown_encoding is None:
             return None
 
-        if not self.known_face_encodings:
+        if not len(self.gallery):
             print("No registered faces found.")
             return None
 
-        # Calculate Euclidean distances
-        distances = [np.linalg.norm(known_encoding - unknown_encoding) for known_encoding in self.known_face_encodings]
-        min_distance_index = np.argmin(distances)
-        min_distance = distances[min_distance_index]
+        return self._match(unknown_encoding)
 
-        # Threshold for recognition (this value needs to be tuned based on your dataset)
-        if min_distance < 0.6:  # A common threshold for OpenFace embeddings
-            return self.known_face_names[min_distance_index]
-        else:
-            return "Unknown"
+    def identify_faces(self, images, batch_size=32):
+        """لكل صورة (الاسم أو "Unknown" أو None، الحالة)؛ الحالة تشرح سبب None (لا وجه، عدة وجوه، تعذر الفك)"""
+        results = []
+        for batch in batches(images, batch_size):
+            encoded = self.encode_images([decode_image(image) for image in batch])
+            for encoding, status in encoded:
+                if encoding is None or not len(self.gallery):
+                    results.append((None, status))
+                else:
+                    results.append((self._match(encoding), status))
+        return results
+
+    def recognize_faces(self, images, batch_size=32):
+        """التعرف على عدة صور على دفعات؛ لكل صورة الاسم أو "Unknown" أو None (لا وجه/خطأ)"""
+        return [name for name, _ in self.identify_faces(images, batch_size)]
 
     def delete_face(self, name):
-        if name in self.known_face_names:
-            indices_to_delete = [i for i, n in enumerate(self.known_face_names) if n == name]
-            for index in sorted(indices_to_delete, reverse=True):
-                del self.known_face_encodings[index]
-                del self.known_face_names[index]
-            self._save_data()
+        if self.gallery.delete_name(name):
+            # row ids change after compaction
+            self.gallery.maybe_compact()
+            self._rebuild_index()
             print(f"Face(s) of {name} deleted successfully.")
             return True
         else:
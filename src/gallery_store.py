@@ -0,0 +1,377 @@
+"""مخزن معرض الوجوه على القرص: مصفوفة float32 ثابتة العرض تُقرأ عبر mmap وتُكتب بالإلحاق فقط
+
+محتوى المجلد:
+- manifest.json: البعد ورقم الجيل الحالي (يُستبدل ذرياً عند الضغط)
+- vectors.<gen>.f32: صفوف float32 متتالية بعرض dim دون ترويسة
+- labels.<gen>.jsonl: سطر JSON لكل صف بنفس الترتيب {"name": ..., "source": ...}
+- tombstones.<gen>.i64: أرقام الصفوف المحذوفة (int64) بالإلحاق
+
+الحذف يضيف شاهداً فقط، والضغط (compact) يكتب جيلاً جديداً بالصفوف الحية ثم يبدّل manifest.
+العمليات القارئة تشارك صفحات المصفوفة نفسها عبر ذاكرة نظام التشغيل. الكتابة (إلحاق، حذف، ضغط، إنشاء)
+تتم تحت قفل حصري بين العمليات على الملف .lock، وكل كاتب يلتقط صفوف غيره قبل أن يكتب.
+"""
+import argparse
+from contextlib import contextmanager
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, use a single writer process
+    fcntl = None
+
+MANIFEST = 'manifest.json'
+LOCK_FILE = '.lock'
+
+
+class GalleryStore:
+    """معرض وجوه بالإلحاق فقط؛ رقم الصف هو معرّف الوجه حتى الضغط التالي"""
+
+    def __init__(self, path, dim=128, compact_ratio=0.25, compact_min_rows=1024):
+        self.path = path
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self.generation = None
+        self._matrix = None
+        self._labels = []
+        self._labels_bytes = 0
+        self._deleted = np.zeros(0, dtype=bool)
+        self.open()
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MANIFEST))
+
+    def _file(self, kind, generation=None):
+        generation = self.generation if generation is None else generation
+        extension = {'vectors': 'f32', 'labels': 'jsonl', 'tombstones': 'i64'}[kind]
+        return os.path.join(self.path, f'{kind}.{generation}.{extension}')
+
+    def _write_manifest(self, generation):
+        temp = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(temp, 'w') as f:
+            json.dump({'dim': self.dim, 'generation': generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, os.path.join(self.path, MANIFEST))
+
+    @contextmanager
+    def _exclusive(self):
+        # reentrant per thread: flock on a second descriptor of the same file would block this process
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, LOCK_FILE), 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writer(self):
+        """قفل الكتابة الحصري؛ يحدّث العرض المحلي من القرص أولاً فتبدأ أرقام الصفوف الجديدة بعد آخر صف كتبه أي كاتب"""
+        with self._exclusive():
+            self.refresh()
+            yield
+
+    def wait_for_writers(self):
+        """انتظار انتهاء أي كاتب جارٍ (مثل تحويل تجريه عملية أخرى) ثم تحديث العرض المحلي"""
+        with self._writer():
+            pass
+
+    def _read_manifest(self):
+        with open(os.path.join(self.path, MANIFEST)) as f:
+            return json.load(f)
+
+    def open(self):
+        """فتح المعرض (أو إنشاؤه)؛ يُستدعى أيضاً لإعادة القراءة بعد ضغط في عملية أخرى"""
+        with self._lock:
+            if not self.exists(self.path):
+                with self._exclusive():
+                    if not self.exists(self.path):
+                        self.generation = 0
+                        for kind in ('vectors', 'labels', 'tombstones'):
+                            open(self._file(kind), 'ab').close()
+                        self._write_manifest(0)
+            manifest = self._read_manifest()
+            if manifest['dim'] != self.dim:
+                raise ValueError(f"Gallery {self.path} has dim {manifest['dim']}, expected {self.dim}")
+            self.generation = manifest['generation']
+            self._labels = []
+            self._labels_bytes = 0
+            self._load_labels()
+            self._map_vectors()
+            self._load_tombstones()
+
+    def _load_labels(self):
+        """قراءة التسميات الجديدة بعد آخر موضع مقروء؛ صف لا تكتمل متجهته بعد لا يُحسب"""
+        available = os.path.getsize(self._file('vectors')) // (self.dim * 4)
+        with open(self._file('labels'), 'rb') as f:
+            f.seek(self._labels_bytes)
+            for line in f:
+                if not line.endswith(b'\n') or len(self._labels) >= available:
+                    break  # torn or in-flight write
+                self._labels.append(json.loads(line))
+                self._labels_bytes += len(line)
+
+    def _repair(self):
+        """قص الذيل غير المكتمل بعد انقطاع كاتب سابق حتى تبقى المصفوفة والتسميات بنفس عدد الصفوف
+
+        يُستدعى تحت _writer فقط: بعد refresh يطابق العرض المحلي آخر صف مكتمل على القرص، وأي بايتات بعده
+        تعود لكاتب انقطع لأن لا كاتب آخر يعمل الآن.
+        """
+        vectors_size = len(self._labels) * self.dim * 4
+        if os.path.getsize(self._file('vectors')) != vectors_size:
+            os.truncate(self._file('vectors'), vectors_size)
+        if os.path.getsize(self._file('labels')) != self._labels_bytes:
+            os.truncate(self._file('labels'), self._labels_bytes)
+
+    def _map_vectors(self):
+        rows = len(self._labels)
+        if rows == 0:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            self._matrix = np.memmap(self._file('vectors'), dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def _load_tombstones(self):
+        deleted = np.zeros(len(self._labels), dtype=bool)
+        rows = np.fromfile(self._file('tombstones'), dtype=np.int64)
+        rows = rows[(rows >= 0) & (rows < deleted.size)]
+        deleted[rows] = True
+        self._deleted = deleted
+
+    def refresh(self):
+        """التقاط الصفوف والحذوفات المضافة من عملية أخرى (أو جيل جديد بعد الضغط)"""
+        with self._lock:
+            if self._read_manifest()['generation'] != self.generation:
+                self.open()
+                return True
+            rows = len(self._labels)
+            deleted = int(self._deleted.sum())
+            self._load_labels()
+            if len(self._labels) > rows:
+                self._map_vectors()
+            self._load_tombstones()
+            return len(self._labels) != rows or int(self._deleted.sum()) != deleted
+
+    def __len__(self):
+        return int((~self._deleted).sum())
+
+    @property
+    def rows(self):
+        """عدد الصفوف المخزنة بما فيها المحذوفة"""
+        return len(self._labels)
+
+    @property
+    def vectors(self):
+        """مصفوفة كل الصفوف (للقراءة فقط، مرتبطة بالملف عبر mmap)"""
+        return self._matrix
+
+    def name(self, row):
+        return self._labels[row]['name']
+
+    def label(self, row):
+        return self._labels[row]
+
+    def is_deleted(self, row):
+        return bool(self._deleted[row])
+
+    def live_rows(self):
+        return np.flatnonzero(~self._deleted)
+
+    def live(self):
+        """(أرقام الصفوف الحية، أسماؤها، متجهاتها) لبناء فهرس البحث"""
+        with self._lock:
+            rows = self.live_rows()
+            return rows, [self._labels[i]['name'] for i in rows], self._matrix[rows]
+
+    def names(self):
+        return [self._labels[i]['name'] for i in self.live_rows()]
+
+    def sources(self):
+        """مصادر الصفوف الحية (مثل بصمة محتوى الصورة) لتخطي ما سُجّل سابقاً"""
+        return {self._labels[i]['source'] for i in self.live_rows() if self._labels[i].get('source')}
+
+    def append(self, encodings, names, sources=None, sync=True):
+        """إلحاق صفوف جديدة؛ يُرجع أرقام صفوفها. تُكتب المتجهات قبل التسميات، فالانقطاع يترك ذيلاً يُقص عند الإلحاق التالي"""
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(names) != vectors.shape[0]:
+            raise ValueError('encodings and names must have the same length')
+        sources = sources if sources is not None else [None] * len(names)
+        labels = [{'name': name, 'source': source} if source else {'name': name}
+                  for name, source in zip(names, sources)]
+
+        with self._writer():
+            self._repair()
+            start = len(self._labels)
+            with open(self._file('vectors'), 'ab') as f:
+                f.write(np.ascontiguousarray(vectors).tobytes())
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            encoded = ''.join(json.dumps(label, ensure_ascii=False) + '\n' for label in labels).encode('utf-8')
+            with open(self._file('labels'), 'ab') as f:
+                f.write(encoded)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            self._labels.extend(labels)
+            self._labels_bytes += len(encoded)
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(labels), dtype=bool)])
+            self._map_vectors()
+            return list(range(start, start + len(labels)))
+
+    def append_unseen(self, encodings, names, sources, sync=True):
+        """مثل append لكنه يتخطى الصفوف التي سُجّل مصدرها من قبل، بما فيها ما أضافته عملية أخرى للتو
+
+        الفحص والإلحاق تحت القفل نفسه بعد التحديث من القرص؛ يُرجع فهارس (في المدخلات) الصفوف التي أُلحقت.
+        """
+        with self._writer():
+            known = self.sources()
+            keep = [i for i, source in enumerate(sources) if source not in known]
+            if keep:
+                self.append([encodings[i] for i in keep], [names[i] for i in keep],
+                            [sources[i] for i in keep], sync=sync)
+            return keep
+
+    def delete(self, rows):
+        """وضع شواهد على الصفوف؛ يُرجع عدد الصفوف الحية التي حُذفت
+
+        أرقام الصفوف تخص الجيل الحالي؛ إذا ضغطت عملية أخرى المعرض في هذه الأثناء تُرفض (استخدم delete_name).
+        """
+        generation = self.generation
+        with self._writer():
+            if self.generation != generation:
+                raise ValueError(f'Gallery {self.path} was compacted by another process; row ids are stale')
+            return self._delete(rows)
+
+    def _delete(self, rows):
+        rows = np.asarray(sorted(set(int(row) for row in rows)), dtype=np.int64)
+        rows = rows[(rows >= 0) & (rows < self._deleted.size)]
+        rows = rows[~self._deleted[rows]]
+        if rows.size:
+            with open(self._file('tombstones'), 'ab') as f:
+                f.write(rows.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._deleted[rows] = True
+        return int(rows.size)
+
+    def delete_name(self, name):
+        with self._writer():
+            return self._delete([i for i in self.live_rows() if self._labels[i]['name'] == name])
+
+    def needs_compaction(self):
+        deleted = int(self._deleted.sum())
+        return deleted >= self.compact_min_rows and deleted >= self.compact_ratio * len(self._labels)
+
+    def maybe_compact(self):
+        if self.needs_compaction():
+            self.compact()
+            return True
+        return False
+
+    def compact(self):
+        """كتابة جيل جديد بالصفوف الحية فقط ثم تبديل manifest؛ أرقام الصفوف تتغير بعدها"""
+        with self._writer():
+            rows = self.live_rows()
+            generation = self.generation + 1
+            with open(self._file('vectors', generation), 'wb') as f:
+                for offset in range(0, rows.size, 65536):
+                    f.write(np.ascontiguousarray(self._matrix[rows[offset:offset + 65536]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._file('labels', generation), 'wb') as f:
+                for i in rows:
+                    f.write((json.dumps(self._labels[i], ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            open(self._file('tombstones', generation), 'wb').close()
+
+            previous = self.generation
+            self._write_manifest(generation)
+            self._matrix = None
+            self.open()
+            for kind in ('vectors', 'labels', 'tombstones'):
+                try:
+                    os.remove(self._file(kind, previous))
+                except OSError:
+                    pass  # another process may still map the old generation (e.g. on Windows)
+            return int(rows.size)
+
+
+def convert_pickle(pickle_path, store_path, dim=128):
+    """تحويل face_data.pkl القديم ({'encodings': [...], 'names': [...]}) إلى GalleryStore
+
+    يُبنى المعرض كاملاً في مجلد مؤقت بجانب store_path ثم يُنقل إلى مكانه بإعادة تسمية ذرية، فالانقطاع
+    في المنتصف لا يترك معرضاً فارغاً يمنع إعادة التحويل. يرفع FileExistsError إذا كان المعرض موجوداً،
+    بما في ذلك تحويلاً أنجزته عملية أخرى في الوقت نفسه.
+    """
+    if GalleryStore.exists(store_path):
+        raise FileExistsError(f'{store_path} already contains a gallery')
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+    encodings = data.get('encodings', [])
+    names = data.get('names', [])
+
+    store_path = os.path.abspath(store_path)
+    temp_path = tempfile.mkdtemp(prefix=os.path.basename(store_path) + '.converting-',
+                                 dir=os.path.dirname(store_path))
+    try:
+        temp_store = GalleryStore(temp_path, dim=dim)
+        if encodings:
+            temp_store.append(np.asarray(encodings, dtype=np.float32).reshape(len(encodings), dim), list(names))
+        if os.path.isdir(store_path) and not GalleryStore.exists(store_path) and os.listdir(store_path) == [LOCK_FILE]:
+            os.remove(os.path.join(store_path, LOCK_FILE))  # left by a creation that never wrote its manifest
+        try:
+            # fails if another process moved its conversion into place first (or a gallery was created meanwhile)
+            os.rename(temp_path, store_path)
+        except OSError as e:
+            raise FileExistsError(f'{store_path} already contains a gallery') from e
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+    return GalleryStore(store_path, dim=dim)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face gallery store maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='convert a face_data.pkl file to a gallery directory')
+    convert.add_argument('pickle_path')
+    convert.add_argument('store_path')
+    compact = subparsers.add_parser('compact', help='drop deleted rows from a gallery directory')
+    compact.add_argument('store_path')
+    info = subparsers.add_parser('info', help='print gallery size')
+    info.add_argument('store_path')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        store = convert_pickle(args.pickle_path, args.store_path)
+        print(f"Converted {len(store)} faces to {args.store_path}")
+    elif args.command == 'compact':
+        store = GalleryStore(args.store_path)
+        print(f"Compacted {args.store_path}: {store.compact()} live faces")
+    else:
+        store = GalleryStore(args.store_path)
+        print(json.dumps({'rows': store.rows, 'live': len(store), 'generation': store.generation}))
@@ -0,0 +1,183 @@
+from datetime import datetime, timezone
+import json
+import math
+
+from models import db, User, UserSession, EmotionSnapshot
+from rollups import update_rollups
+
+
+class SnapshotValidationError(ValueError):
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.index = index
+
+
+def parse_reading_timestamp(value, default=None):
+    """قبول طابع زمني ISO-8601 أو رقم بالمللي ثانية (Date.now في المتصفح) وإرجاعه UTC بدون منطقة
+
+    القيم خارج نطاق datetime (OverflowError/OSError) تُرفع ValueError مثل أي طابع غير صالح.
+    """
+    if value is None:
+        return default or datetime.utcnow()
+    if isinstance(value, bool):
+        raise ValueError('invalid timestamp')
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc).replace(tzinfo=None)
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+    except (OverflowError, OSError) as e:
+        raise ValueError(f'timestamp out of range: {value!r:.40}') from e
+    raise ValueError('invalid timestamp')
+
+
+def _number(value, field, default=None):
+    """رقم منتهٍ (وليس bool) أو None؛ غير ذلك ValueError حتى لا يفشل الإدراج لاحقاً"""
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f'{field} must be a finite number')
+    return value
+
+
+def _string(value, field, max_length):
+    if value is None:
+        return None
+    if not isinstance(value, str) or len(value) > max_length:
+        raise ValueError(f'{field} must be a string of at most {max_length} characters')
+    return value
+
+
+def build_snapshot_row(user_id, session_id, reading, manual_save=False, timestamp=None):
+    """تحويل قراءة واحدة (بنفس صيغة /api/emotions/analyze) إلى صف جاهز للإدراج
+
+    كل حقل يُتحقق من نوعه هنا (ValueError)، فالصف الناتج لا يفشل عند الإدراج، بما في ذلك من طابور الكتابة المؤجلة.
+    """
+    emotions_data = reading.get('emotions') or {}
+    face_data = reading.get('face_data') or {}
+    age_gender_data = reading.get('age_gender_data') or {}
+
+    if not isinstance(emotions_data, dict) or not isinstance(face_data, dict) or not isinstance(age_gender_data, dict):
+        raise ValueError('emotions, face_data and age_gender_data must be objects')
+
+    for emotion, value in emotions_data.items():
+        _string(emotion, 'emotion name', 50)
+        if _number(value, f'emotions.{emotion}') is None:
+            raise ValueError(f'emotions.{emotion} must be a finite number')
+
+    face_detected = face_data.get('face_detected', False)
+    if face_detected is None:
+        face_detected = False
+    if not isinstance(face_detected, bool):
+        raise ValueError('face_data.face_detected must be a boolean')
+    face_count = _number(face_data.get('face_count'), 'face_data.face_count', default=0)
+    face_confidence = _number(face_data.get('face_confidence'), 'face_data.face_confidence')
+    detected_age = _number(age_gender_data.get('age'), 'age_gender_data.age')
+    age_confidence = _number(age_gender_data.get('age_confidence'), 'age_gender_data.age_confidence')
+    gender_confidence = _number(age_gender_data.get('gender_confidence'), 'age_gender_data.gender_confidence')
+    detected_gender = _string(age_gender_data.get('gender'), 'age_gender_data.gender', 20)
+    note = _string(reading.get('note'), 'note', 10000)
+
+    dominant_emotion = 'neutral'
+    emotion_intensity = 0.0
+
+    if emotions_data:
+        dominant_emotion = max(emotions_data, key=emotions_data.get)
+        emotion_intensity = emotions_data.get(dominant_emotion, 0.0) / 100.0
+
+    return {
+        'user_id': user_id,
+        'session_id': session_id,
+        'timestamp': timestamp or parse_reading_timestamp(reading.get('timestamp')),
+        'emotions_data': json.dumps(emotions_data) if emotions_data else '{}',
+        'dominant_emotion': dominant_emotion,
+        'emotion_intensity': emotion_intensity,
+        'face_detected': face_detected,
+        'face_count': int(face_count),
+        'face_confidence': face_confidence,
+        'face_box': json.dumps(face_data['face_box']) if face_data.get('face_box') else None,
+        'detected_age': detected_age,
+        'detected_gender': detected_gender,
+        'age_confidence': age_confidence,
+        'gender_confidence': gender_confidence,
+        'is_manual_save': bool(reading.get('manual_save', manual_save)),
+        'note': note
+    }
+
+
+def build_snapshot_rows(user_id, session_id, readings, max_size=500):
+    if not isinstance(readings, list) or not readings:
+        raise SnapshotValidationError('readings must be a non-empty list')
+    if len(readings) > max_size:
+        raise SnapshotValidationError(f'At most {max_size} readings per batch')
+
+    rows = []
+    for i, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            raise SnapshotValidationError('reading must be an object', index=i)
+        try:
+            rows.append(build_snapshot_row(user_id, session_id, reading))
+        except (TypeError, ValueError) as e:
+            raise SnapshotValidationError(str(e), index=i)
+    return rows
+
+
+def _best_reading(rows, value_key, confidence_key):
+    best = None
+    for row in rows:
+        if row[value_key] and (row[confidence_key] or 0) > 0:
+            if best is None or row[confidence_key] > best[confidence_key]:
+                best = row
+    return best
+
+
+def persist_snapshot_rows(rows):
+    """إدراج الصفوف بإدراج متعدد واحد وتحديث الجلسة والمستخدم والتجميعات اليومية مرة واحدة (بدون commit)"""
+    if not rows:
+        return 0
+
+    db.session.execute(db.insert(EmotionSnapshot), rows)
+    update_rollups(rows)
+
+    by_session = {}
+    for row in rows:
+        by_session.setdefault((row['session_id'], row['user_id']), []).append(row)
+
+    now = datetime.utcnow()
+    for (session_id, user_id), session_rows in by_session.items():
+        db.session.execute(
+            db.update(UserSession)
+            .where(UserSession.session_id == session_id)
+            .values(total_snapshots=db.func.coalesce(UserSession.total_snapshots, 0) + len(session_rows))
+        )
+
+        db.session.execute(
+            db.update(User).where(User.id == user_id).values(last_seen=now)
+        )
+
+        best_age = _best_reading(session_rows, 'detected_age', 'age_confidence')
+        if best_age:
+            db.session.execute(
+                db.update(User)
+                .where(
+                    User.id == user_id,
+                    db.or_(User.age_confidence.is_(None), User.age_confidence < best_age['age_confidence'])
+                )
+                .values(detected_age=int(best_age['detected_age']), age_confidence=best_age['age_confidence'])
+            )
+
+        best_gender = _best_reading(session_rows, 'detected_gender', 'gender_confidence')
+        if best_gender:
+            db.session.execute(
+                db.update(User)
+                .where(
+                    User.id == user_id,
+                    db.or_(User.gender_confidence.is_(None), User.gender_confidence < best_gender['gender_confidence'])
+                )
+                .values(detected_gender=best_gender['detected_gender'], gender_confidence=best_gender['gender_confidence'])
+            )
+
+    return len(rows)
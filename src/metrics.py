@@ -0,0 +1,234 @@
+from bisect import bisect_left
+import heapq
+import re
+import threading
+import time
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_LOG_CHARS = 300
+
+_METRIC_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class LatencyHistogram:
+    """مدرج تراكمي بحدود ثابتة (بالثواني) بصيغة Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            yield bound, running
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class RequestMetrics:
+    """زمن كل مسار وعدد استعلامات SQL وزمنها لكل طلب، مع تسجيل الطلبات البطيئة
+
+    القيم محلية لكل عملية؛ مع عدة عمليات يجمعها Prometheus من كل عملية على حدة.
+    يمكن إيقاف القياس وتشغيله أثناء التشغيل عبر enabled دون إعادة تسجيل الخطافات.
+    أثناء القياس تُحفظ أبطأ slow_statements عبارات SQL لكل طلب، وتُسجّل مع تحذير الطلب البطيء.
+    """
+
+    def __init__(self, app=None, db=None, enabled=True, slow_request_ms=500, slow_statements=5,
+                 buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.slow_request_ms = slow_request_ms
+        self.slow_statements = slow_statements
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._responses = {}
+        self._db = {'queries': 0, 'seconds': 0.0}
+        self._slow_requests = 0
+        self._collectors = {}
+        self.started_at = time.time()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def register_collector(self, name, collect):
+        """collect() تُرجع قاموساً؛ القيم الرقمية تظهر كمقاييس gauge باسم emotion_<name>_<key>"""
+        self._collectors[name] = collect
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+        g.metrics_statements = []  # min-heap of the slowest (seconds, seq, statement)
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        key = (request.method, route)
+        status = f'{response.status_code // 100}xx'
+        queries = g.get('metrics_queries', 0)
+        db_seconds = g.get('metrics_db_seconds', 0.0)
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.buckets)
+            histogram.observe(elapsed)
+            self._responses[key + (status,)] = self._responses.get(key + (status,), 0) + 1
+            self._db['queries'] += queries
+            self._db['seconds'] += db_seconds
+            slow = elapsed * 1000.0 >= self.slow_request_ms
+            if slow:
+                self._slow_requests += 1
+
+        if slow:
+            statements = sorted(g.pop('metrics_statements', []), reverse=True)
+            details = ''.join(
+                f"\n  {seconds * 1000.0:.1f}ms {' '.join(statement.split())[:STATEMENT_LOG_CHARS]}"
+                for seconds, _, statement in statements
+            )
+            self.app.logger.warning(
+                f"Slow request: {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                f"in {elapsed * 1000.0:.1f}ms ({queries} queries, {db_seconds * 1000.0:.1f}ms in DB){details}"
+            )
+
+        response.headers['Server-Timing'] = f'app;dur={elapsed * 1000.0:.1f}, db;dur={db_seconds * 1000.0:.1f}'
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled and has_request_context() and 'metrics_start' in g:
+            conn.info['metrics_query_start'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('metrics_query_start', None)
+        if start is None or not has_request_context() or 'metrics_start' not in g:
+            return
+        seconds = time.perf_counter() - start
+        g.metrics_db_seconds += seconds
+        g.metrics_queries += 1
+        statements = g.get('metrics_statements')
+        if statements is not None and self.slow_statements > 0:
+            if executemany:
+                statement = f'{statement} [executemany x{len(parameters)}]'
+            entry = (seconds, g.metrics_queries, statement)
+            if len(statements) < self.slow_statements:
+                heapq.heappush(statements, entry)
+            elif seconds > statements[0][0]:
+                heapq.heapreplace(statements, entry)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._responses.clear()
+            self._db = {'queries': 0, 'seconds': 0.0}
+            self._slow_requests = 0
+
+    def summary(self):
+        with self._lock:
+            routes = {
+                f'{method} {route}': {
+                    'count': histogram.count,
+                    'avg_ms': round(histogram.total / histogram.count * 1000.0, 2) if histogram.count else 0.0
+                }
+                for (method, route), histogram in self._histograms.items()
+            }
+            return {
+                'enabled': self.enabled,
+                'slow_request_ms': self.slow_request_ms,
+                'slow_statements': self.slow_statements,
+                'slow_requests': self._slow_requests,
+                'db_queries': self._db['queries'],
+                'db_seconds': round(self._db['seconds'], 4),
+                'routes': routes
+            }
+
+    def render_prometheus(self):
+        with self._lock:
+            histograms = {key: (list(h.cumulative()), h.total, h.count) for key, h in self._histograms.items()}
+            responses = dict(self._responses)
+            db_stats = dict(self._db)
+            slow_requests = self._slow_requests
+
+        lines = [
+            '# HELP emotion_http_request_duration_seconds Request latency by route.',
+            '# TYPE emotion_http_request_duration_seconds histogram'
+        ]
+        for (method, route), (buckets, total, count) in sorted(histograms.items()):
+            for bound, cumulative in buckets:
+                labels = _labels(method=method, route=route, le=_format_bound(bound))
+                lines.append(f'emotion_http_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(method=method, route=route)
+            lines.append(f'emotion_http_request_duration_seconds_sum{labels} {total}')
+            lines.append(f'emotion_http_request_duration_seconds_count{labels} {count}')
+
+        lines += [
+            '# HELP emotion_http_responses_total Responses by route and status class.',
+            '# TYPE emotion_http_responses_total counter'
+        ]
+        for (method, route, status), count in sorted(responses.items()):
+            lines.append(f'emotion_http_responses_total{_labels(method=method, route=route, status=status)} {count}')
+
+        lines += [
+            '# HELP emotion_db_queries_total SQL statements executed while serving requests.',
+            '# TYPE emotion_db_queries_total counter',
+            f'emotion_db_queries_total {db_stats["queries"]}',
+            '# HELP emotion_db_seconds_total Time spent in SQL statements while serving requests.',
+            '# TYPE emotion_db_seconds_total counter',
+            f'emotion_db_seconds_total {db_stats["seconds"]}',
+            '# HELP emotion_slow_requests_total Requests slower than the slow request threshold.',
+            '# TYPE emotion_slow_requests_total counter',
+            f'emotion_slow_requests_total {slow_requests}',
+            '# TYPE emotion_metrics_enabled gauge',
+            f'emotion_metrics_enabled {int(self.enabled)}',
+            '# TYPE emotion_process_start_time_seconds gauge',
+            f'emotion_process_start_time_seconds {self.started_at}'
+        ]
+
+        for name, collect in sorted(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = _METRIC_NAME.sub('_', f'emotion_{name}_{key}')
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -1,9 +1,11 @@
 
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime, timedelta
 import json
 import uuid
+import numpy as np
 
 db = SQLAlchemy()
 
@@ -63,6 +65,10 @@ class UserSession(db.Model):
     total_snapshots = db.Column(db.Integer, default=0)
     total_analysis_time = db.Column(db.Integer, default=0)  
     
+    __table_args__ = (
+        db.Index('idx_user_sessions_user_start', 'user_id', 'start_time'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -156,7 +162,7 @@ class FaceEncoding(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
-    encoding_data = db.Column(db.Text, nullable=False)  
+    encoding_data = db.Column(db.LargeBinary, nullable=False)
     label = db.Column(db.String(100), nullable=True)
     confidence_threshold = db.Column(db.Float, default=0.6)
     
@@ -167,20 +173,36 @@ class FaceEncoding(db.Model):
     face_image_path = db.Column(db.String(255), nullable=True)
     face_quality_score = db.Column(db.Float, nullable=True)
     
+    @staticmethod
+    def decode_encoding(raw):
+        """تحويل البيانات المخزنة إلى مصفوفة float32 (ثنائية بدون نسخ أو JSON قديم)"""
+        if not raw:
+            return np.empty(0, dtype=np.float32)
+        if isinstance(raw, str):
+            try:
+                return np.asarray(json.loads(raw), dtype=np.float32)
+            except:
+                return np.empty(0, dtype=np.float32)
+        return np.frombuffer(raw, dtype=np.float32)
+    
+    @staticmethod
+    def encode_encoding(data):
+        if data is None or len(data) == 0:
+            return b''
+        return np.ascontiguousarray(data, dtype=np.float32).tobytes()
+    
     def get_encoding_data(self):
-        try:
-            return json.loads(self.encoding_data) if self.encoding_data else []
-        except:
-            return []
+        return self.decode_encoding(self.encoding_data)
     
     def set_encoding_data(self, data):
-        self.encoding_data = json.dumps(data) if data else '[]'
+        """حفظ المتجه كـ float32 خام (512 بايت لـ 128 قيمة)"""
+        self.encoding_data = self.encode_encoding(data)
     
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'encoding_data': self.get_encoding_data(),
+            'encoding_data': self.get_encoding_data().tolist(),
             'label': self.label,
             'confidence_threshold': self.confidence_threshold,
             'created_at': self.created_at.isoformat() if self.created_at else None,
@@ -254,6 +276,7 @@ class EmotionStatistics(db.Model):
     fearful_count = db.Column(db.Integer, default=0)
     disgusted_count = db.Column(db.Integer, default=0)
     neutral_count = db.Column(db.Integer, default=0)
+    other_count = db.Column(db.Integer, default=0)  # dominant emotions outside the seven above
     
     avg_emotion_intensity = db.Column(db.Float, default=0.0)
     
@@ -280,35 +303,107 @@ class EmotionStatistics(db.Model):
                 'surprised': self.surprised_count,
                 'fearful': self.fearful_count,
                 'disgusted': self.disgusted_count,
-                'neutral': self.neutral_count
+                'neutral': self.neutral_count,
+                'other': self.other_count
             },
             'avg_emotion_intensity': self.avg_emotion_intensity,
             'avg_face_confidence': self.avg_face_confidence,
             'total_faces_detected': self.total_faces_detected
         }
 
+SQLITE_SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def configure_sqlite(engine, journal_mode='WAL', busy_timeout=5000, synchronous='NORMAL', mmap_size=0):
+    """ضبط PRAGMA لكل اتصال SQLite جديد للاستخدام المتزامن من عدة عمليات وخيوط"""
+    synchronous = synchronous.upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f'synchronous must be one of {SQLITE_SYNCHRONOUS_LEVELS}')
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.close()
+
 def init_db(app):
     db.init_app(app)
     
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            configure_sqlite(db.engine, **app.config.get('SQLITE_PRAGMAS', {}))
+        
         db.create_all()
         
         try:
-            db.engine.execute("""
-                CREATE INDEX IF NOT EXISTS idx_emotion_snapshots_user_time_emotion 
-                ON emotion_snapshots(user_id, timestamp DESC, dominant_emotion)
-            """)
-            
-            db.engine.execute("""
-                CREATE INDEX IF NOT EXISTS idx_user_sessions_active_expires 
-                ON user_sessions(is_active, expires_at)
-            """)
+            columns = {column['name'] for column in db.inspect(db.engine).get_columns('emotion_statistics')}
+            if 'other_count' not in columns:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text("ALTER TABLE emotion_statistics ADD COLUMN other_count INTEGER DEFAULT 0"))
+        except Exception as e:
+            print(f" تحذير: لم يتم تحديث جدول emotion_statistics: {e}")
+        
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.text("""
+                    CREATE INDEX IF NOT EXISTS idx_emotion_snapshots_user_time_emotion 
+                    ON emotion_snapshots(user_id, timestamp DESC, dominant_emotion)
+                """))
+                
+                conn.execute(db.text("""
+                    CREATE INDEX IF NOT EXISTS idx_user_sessions_active_expires 
+                    ON user_sessions(is_active, expires_at)
+                """))
+                
+                conn.execute(db.text("""
+                    CREATE INDEX IF NOT EXISTS idx_user_sessions_user_start 
+                    ON user_sessions(user_id, start_time)
+                """))
+                
+                conn.execute(db.text("""
+                    CREATE INDEX IF NOT EXISTS idx_emotion_snapshots_time_emotion 
+                    ON emotion_snapshots(timestamp, dominant_emotion)
+                """))
             
             print(" تم إنشاء قاعدة البيانات والفهارس بنجاح")
             
         except Exception as e:
             print(f" تحذير: لم يتم إنشاء بعض الفهارس: {e}")
 
+def migrate_face_encodings_to_binary(batch_size=500):
+    """تحويل صفوف face_encodings المخزنة كنص JSON إلى الصيغة الثنائية على دفعات"""
+    converted = 0
+    last_id = 0
+    
+    while True:
+        rows = db.session.execute(
+            db.text(
+                "SELECT id, encoding_data FROM face_encodings "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {'last_id': last_id, 'limit': batch_size}
+        ).all()
+        
+        if not rows:
+            break
+        
+        last_id = rows[-1][0]
+        updates = [
+            {'id': face_id, 'encoding_data': FaceEncoding.encode_encoding(FaceEncoding.decode_encoding(raw))}
+            for face_id, raw in rows
+            if isinstance(raw, str)
+        ]
+        
+        if updates:
+            db.session.execute(db.update(FaceEncoding), updates)
+            db.session.commit()
+            converted += len(updates)
+    
+    return converted
+
 def create_sample_data():
     try:
         sample_user = User(
@@ -0,0 +1,134 @@
+from functools import wraps
+import threading
+import time
+import uuid
+
+from flask import request, make_response
+
+
+class ResponseCache:
+    """تخزين مؤقت لاستجابات GET فوق أي واجهة flask_caching
+
+    المفتاح يشمل المسار وسلسلة الاستعلام المرتبة وأجيال المجموعات؛ الإبطال عند الكتابة
+    يغيّر جيل المجموعة فتصبح كل المفاتيح القديمة غير مستخدمة حتى تنتهي صلاحيتها.
+    الجيل دائماً قيمة عشوائية، فإذا أسقط الخادم عداد مجموعة يُنشأ جيل جديد ولا تعود الاستجابات القديمة.
+    """
+
+    def __init__(self, cache, prefix='response'):
+        self.cache = cache
+        self.prefix = prefix
+        self._last_invalidation = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _generation_key(self, group):
+        return f"{self.prefix}:generation:{group}"
+
+    def _generations(self, groups):
+        if not groups:
+            return ''
+        keys = [self._generation_key(group) for group in groups]
+        values = self.cache.get_many(*keys)
+        return ','.join(
+            str(value) if value is not None else self._new_generation(key)
+            for key, value in zip(keys, values)
+        )
+
+    def _new_generation(self, key):
+        # a missing counter (never set, or evicted by the backend) gets a fresh random generation rather
+        # than a fixed default, so responses cached under an evicted generation are never reachable again
+        self.cache.add(key, uuid.uuid4().hex, timeout=0)
+        value = self.cache.get(key)  # another worker may have added first
+        if value is None:
+            raise KeyError(key)  # the backend cannot hold it: do not cache this response
+        return str(value)
+
+    def _make_key(self, endpoint, groups):
+        query = '&'.join(
+            f"{key}={value}"
+            for key, values in sorted(request.args.lists())
+            for value in sorted(values)
+        )
+        return f"{self.prefix}:{endpoint}:{request.path}?{query}#{self._generations(groups)}"
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def cached(self, timeout, groups=()):
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                try:
+                    self._flush_pending(groups)
+                    key = self._make_key(f.__name__, groups)
+                    entry = self.cache.get(key)
+                except Exception:
+                    return f(*args, **kwargs)
+
+                if entry is not None:
+                    self._count('hits')
+                    body, status, mimetype = entry
+                    response = make_response(body, status)
+                    response.mimetype = mimetype
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    try:
+                        self.cache.set(key, (response.get_data(), response.status_code, response.mimetype), timeout=timeout)
+                    except Exception:
+                        pass
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+    def invalidate(self, *groups, min_interval=0.0):
+        """إبطال المجموعات؛ min_interval يحد عدد مرات الإبطال من مسارات الكتابة الكثيفة
+
+        الإبطال المؤجل لا يُسقط: تُعلَّم المجموعة ويُنفّذ عند أول قراءة لها في هذه العملية
+        أو عند انتهاء الفترة (لقراءات العمليات الأخرى)، أيهما أسبق.
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for group in groups:
+                remaining = self._last_invalidation.get(group, float('-inf')) + min_interval - now
+                if remaining <= 0:
+                    due.append(group)
+                    self._last_invalidation[group] = now
+                    self._pending.discard(group)
+                elif group not in self._pending:
+                    self._pending.add(group)
+                    timer = threading.Timer(remaining, self._flush_pending, args=((group,),))
+                    timer.daemon = True
+                    timer.start()
+            self._stats['invalidations'] += len(due)
+        self._bump(due)
+
+    def _flush_pending(self, groups):
+        if not self._pending:
+            return
+        now = time.monotonic()
+        with self._lock:
+            due = [group for group in groups if group in self._pending]
+            for group in due:
+                self._pending.discard(group)
+                self._last_invalidation[group] = now
+            self._stats['invalidations'] += len(due)
+        self._bump(due)
+
+    def _bump(self, groups):
+        if groups:
+            try:
+                self.cache.set_many({self._generation_key(group): uuid.uuid4().hex for group in groups}, timeout=0)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,272 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, EmotionSnapshot, EmotionStatistics
+
+EMOTION_COLUMNS = {
+    'happy': 'happy_count',
+    'sad': 'sad_count',
+    'angry': 'angry_count',
+    'surprised': 'surprised_count',
+    'fearful': 'fearful_count',
+    'disgusted': 'disgusted_count',
+    'neutral': 'neutral_count'
+}
+OTHER_COLUMN = 'other_count'
+# every count column of a rollup: the seven emotions plus 'other' for any other dominant emotion
+COUNT_COLUMNS = dict(EMOTION_COLUMNS, other=OTHER_COLUMN)
+
+_DIALECT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert
+}
+
+
+def _empty_rollup(user_id, day, period_type):
+    rollup = {
+        'user_id': user_id,
+        'date': day,
+        'period_type': period_type,
+        'total_snapshots': 0,
+        'total_analysis_time': 0,
+        'avg_emotion_intensity': 0.0,
+        'avg_face_confidence': 0.0,
+        'total_faces_detected': 0
+    }
+    for column in COUNT_COLUMNS.values():
+        rollup[column] = 0
+    return rollup
+
+
+def accumulate_rollups(rows, period_type='daily'):
+    """تجميع صفوف اللقطات حسب (المستخدم، اليوم) إلى قيم جاهزة للـ upsert
+
+    متوسط ثقة الوجه محسوب على اللقطات التي اكتُشف فيها وجه (total_faces_detected).
+    المشاعر خارج EMOTION_COLUMNS تُعد في other_count، فمجموع الأعمدة يساوي total_snapshots دائماً.
+    """
+    rollups = {}
+    for row in rows:
+        key = (row['user_id'], row['timestamp'].date())
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = _empty_rollup(key[0], key[1], period_type)
+
+        rollup['total_snapshots'] += 1
+        rollup[EMOTION_COLUMNS.get(row['dominant_emotion'], OTHER_COLUMN)] += 1
+        rollup['avg_emotion_intensity'] += row['emotion_intensity'] or 0.0
+        if row['face_detected']:
+            rollup['total_faces_detected'] += 1
+            rollup['avg_face_confidence'] += row['face_confidence'] or 0.0
+
+    for rollup in rollups.values():
+        rollup['avg_emotion_intensity'] /= rollup['total_snapshots']
+        if rollup['total_faces_detected']:
+            rollup['avg_face_confidence'] /= rollup['total_faces_detected']
+
+    return list(rollups.values())
+
+
+def _weighted_average(column, weight, excluded_column, excluded_weight):
+    total = weight + excluded_weight
+    return db.case(
+        (total > 0, (column * weight + excluded_column * excluded_weight) / total),
+        else_=0.0
+    )
+
+
+def upsert_rollups(rollups):
+    """دمج القيم المجمعة في emotion_statistics بـ INSERT ... ON CONFLICT DO UPDATE (بدون commit)"""
+    if not rollups:
+        return 0
+
+    insert = _DIALECT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        return _merge_rollups(rollups)
+
+    table = EmotionStatistics.__table__
+    stmt = insert(table)
+    excluded = stmt.excluded
+    old_total = db.func.coalesce(table.c.total_snapshots, 0)
+    old_faces = db.func.coalesce(table.c.total_faces_detected, 0)
+
+    updates = {
+        'total_snapshots': old_total + excluded.total_snapshots,
+        'total_faces_detected': old_faces + excluded.total_faces_detected,
+        'avg_emotion_intensity': _weighted_average(
+            db.func.coalesce(table.c.avg_emotion_intensity, 0.0), old_total,
+            excluded.avg_emotion_intensity, excluded.total_snapshots
+        ),
+        'avg_face_confidence': _weighted_average(
+            db.func.coalesce(table.c.avg_face_confidence, 0.0), old_faces,
+            excluded.avg_face_confidence, excluded.total_faces_detected
+        )
+    }
+    for column in COUNT_COLUMNS.values():
+        updates[column] = db.func.coalesce(table.c[column], 0) + excluded[column]
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date', 'period_type'],
+        set_=updates
+    )
+    db.session.execute(stmt, rollups)
+    return len(rollups)
+
+
+def _merge_rollups(rollups):
+    for rollup in rollups:
+        existing = EmotionStatistics.query.filter_by(
+            user_id=rollup['user_id'], date=rollup['date'], period_type=rollup['period_type']
+        ).first()
+        if existing is None:
+            db.session.add(EmotionStatistics(**rollup))
+            continue
+
+        old_total = existing.total_snapshots or 0
+        old_faces = existing.total_faces_detected or 0
+        total = old_total + rollup['total_snapshots']
+        faces = old_faces + rollup['total_faces_detected']
+        existing.avg_emotion_intensity = (
+            (existing.avg_emotion_intensity or 0.0) * old_total
+            + rollup['avg_emotion_intensity'] * rollup['total_snapshots']
+        ) / total
+        if faces:
+            existing.avg_face_confidence = (
+                (existing.avg_face_confidence or 0.0) * old_faces
+                + rollup['avg_face_confidence'] * rollup['total_faces_detected']
+            ) / faces
+        existing.total_snapshots = total
+        existing.total_faces_detected = faces
+        for column in COUNT_COLUMNS.values():
+            setattr(existing, column, (getattr(existing, column) or 0) + rollup[column])
+    return len(rollups)
+
+
+def update_rollups(rows):
+    return upsert_rollups(accumulate_rollups(rows))
+
+
+def rebuild_rollups(chunk_size=5000, period_type='daily', atomic=False):
+    """إعادة بناء emotion_statistics من كل اللقطات التاريخية على دفعات بمفتاح id
+
+    atomic=True ينفذ الحذف وكل الدفعات في معاملة واحدة، فإعادتا بناء متزامنتان لا تتداخلان.
+    """
+    EmotionStatistics.query.filter_by(period_type=period_type).delete()
+    if not atomic:
+        db.session.commit()
+
+    processed = 0
+    last_id = 0
+    columns = (
+        EmotionSnapshot.id,
+        EmotionSnapshot.user_id,
+        EmotionSnapshot.timestamp,
+        EmotionSnapshot.dominant_emotion,
+        EmotionSnapshot.emotion_intensity,
+        EmotionSnapshot.face_detected,
+        EmotionSnapshot.face_confidence
+    )
+
+    while True:
+        chunk = db.session.query(*columns).filter(
+            EmotionSnapshot.id > last_id,
+            EmotionSnapshot.timestamp.isnot(None)
+        ).order_by(EmotionSnapshot.id).limit(chunk_size).all()
+
+        if not chunk:
+            break
+
+        last_id = chunk[-1].id
+        upsert_rollups(accumulate_rollups((row._asdict() for row in chunk), period_type))
+        if not atomic:
+            db.session.commit()
+        processed += len(chunk)
+
+    db.session.commit()
+    return processed
+
+
+def backfill_rollups(chunk_size=5000, period_type='daily'):
+    """بناء التجميعات عند أول تشغيل على قاعدة فيها لقطات بلا تجميعات؛ يُرجع عدد اللقطات أو None إذا لم يلزم"""
+    if EmotionStatistics.query.filter_by(period_type=period_type).first() is not None:
+        return None
+    if EmotionSnapshot.query.first() is None:
+        return None
+    # several workers may start together; each rebuild replaces the whole table in one transaction
+    return rebuild_rollups(chunk_size=chunk_size, period_type=period_type, atomic=True)
+
+
+def sum_rollups(query):
+    """جمع صفوف emotion_statistics المطابقة في استعلام واحد: (إجمالي اللقطات، توزيع المشاعر)"""
+    totals = query.with_entities(
+        db.func.coalesce(db.func.sum(EmotionStatistics.total_snapshots), 0),
+        *[db.func.coalesce(db.func.sum(getattr(EmotionStatistics, column)), 0)
+          for column in COUNT_COLUMNS.values()]
+    ).one()
+
+    distribution = {
+        emotion: int(count)
+        for emotion, count in zip(COUNT_COLUMNS, totals[1:])
+        if count
+    }
+    return int(totals[0]), distribution
+
+
+TREND_BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1)
+}
+
+
+def _bucket_start(moment, bucket):
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = datetime.combine(moment.date(), datetime.min.time())
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _bucket_label(moment, bucket):
+    return moment.strftime('%Y-%m-%d %H:00' if bucket == 'hour' else '%Y-%m-%d')
+
+
+def _bucket_expression(bucket):
+    timestamp = EmotionSnapshot.timestamp
+    if bucket == 'hour':
+        return db.func.strftime('%Y-%m-%d %H:00', timestamp)
+    if bucket == 'week':
+        # Monday of the ISO week, matching _bucket_start
+        return db.func.date(timestamp, 'weekday 0', '-6 days')
+    return db.func.strftime('%Y-%m-%d', timestamp)
+
+
+def emotion_trends(start, end, bucket='day'):
+    """توزيع المشاعر لكل فترة (ساعة/يوم/أسبوع) في استعلام واحد محدود بنطاق timestamp
+
+    عدد الاستعلامات ثابت مهما طالت النافذة؛ الفترات الفارغة تظهر كقواميس فارغة.
+    """
+    step = TREND_BUCKETS[bucket]
+    start = _bucket_start(start, bucket)
+
+    trends = {}
+    cursor = start
+    while cursor <= end:
+        trends[_bucket_label(cursor, bucket)] = {}
+        cursor += step
+
+    bucket_column = _bucket_expression(bucket).label('bucket')
+    rows = db.session.query(
+        bucket_column,
+        EmotionSnapshot.dominant_emotion,
+        db.func.count(EmotionSnapshot.id)
+    ).filter(
+        EmotionSnapshot.timestamp >= start,
+        EmotionSnapshot.timestamp <= end
+    ).group_by(bucket_column, EmotionSnapshot.dominant_emotion).all()
+
+    for label, emotion, count in rows:
+        trends.setdefault(label, {})[emotion] = count
+
+    return trends
@@ -0,0 +1,95 @@
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+import threading
+import time
+
+from models import db, UserSession
+
+ResolvedSession = namedtuple('ResolvedSession', ['session_id', 'user_id', 'expires_at'])
+
+
+class SessionResolver:
+    """حل X-Session-ID إلى مستخدم مع ذاكرة مؤقتة TTL/LRU داخل العملية
+
+    لا تُخزَّن إلا الجلسات النشطة؛ الإلغاء عند الخروج أو التنظيف يتم عبر invalidate.
+    في حالة تعدد العمليات قد تبقى جلسة ملغاة صالحة في عملية أخرى حتى انتهاء ttl.
+    """
+
+    def __init__(self, ttl=30.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0}
+
+    def _lookup(self, session_id):
+        row = db.session.query(UserSession.user_id, UserSession.expires_at).filter_by(
+            session_id=session_id, is_active=True
+        ).first()
+        if row is None:
+            return None
+        return ResolvedSession(session_id, row.user_id, row.expires_at)
+
+    def resolve(self, session_id):
+        """إرجاع ResolvedSession للجلسة النشطة غير المنتهية أو None"""
+        if not session_id:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(session_id)
+                self._stats['hits'] += 1
+                resolved = entry[0]
+            else:
+                if entry is not None:
+                    del self._entries[session_id]
+                self._stats['misses'] += 1
+                resolved = None
+
+        if resolved is None:
+            resolved = self._lookup(session_id)
+            if resolved is None:
+                return None
+            if self.ttl > 0:
+                with self._lock:
+                    self._entries[session_id] = (resolved, now + self.ttl)
+                    self._entries.move_to_end(session_id)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+
+        if resolved.expires_at is not None and resolved.expires_at < datetime.utcnow():
+            self.invalidate(session_id)
+            with self._lock:
+                self._stats['expired'] += 1
+            return None
+
+        return resolved
+
+    def invalidate(self, session_id):
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            stale = [key for key, (resolved, _) in self._entries.items() if resolved.user_id == user_id]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['ttl'] = self.ttl
+        stats['max_size'] = self.max_size
+        return stats
@@ -1,14 +1,77 @@
+from itertools import islice
+
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import json
 
+FORECAST_NOTE = "تنبؤ أولي بناءً على آخر نقطة بيانات بسبب محدودية البيانات. يتطلب نموذجًا أكثر تعقيدًا وبيانات أكبر لتنبؤات دقيقة."
+NO_DATA_NOTE = "لا توجد بيانات للتنبؤ."
+
+
+def parse_timestamps(values):
+    """تحويل كل الطوابع الزمنية (نص ISO أو datetime أو مللي ثانية) باستدعاء to_datetime واحد"""
+    array = np.asarray(values)
+    if array.dtype.kind in 'iuf':
+        return pd.to_datetime(array, unit='ms', utc=True)
+    if array.dtype.kind == 'M':
+        return pd.to_datetime(array)
+    try:
+        return pd.to_datetime(array, format='ISO8601')
+    except (ValueError, TypeError):
+        # mixed UTC offsets cannot share one tz-aware dtype without normalizing
+        return pd.to_datetime(array, format='ISO8601', utc=True)
+
+
 class EmotionAnalyzer:
     def __init__(self, data):
         self.data = data
         self.emotion_types = self._get_emotion_types()
         self.df = self._process_data()
 
+    @classmethod
+    def _from_frame(cls, df, emotion_types):
+        analyzer = cls.__new__(cls)
+        analyzer.data = None
+        analyzer.emotion_types = list(emotion_types)
+        analyzer.df = df
+        return analyzer
+
+    @classmethod
+    def from_arrays(cls, timestamps, emotions, emotion_types):
+        """بناء المحلل من مدخلات عمودية: مصفوفة طوابع زمنية بطول N ومصفوفة مشاعر N×E"""
+        emotion_types = list(emotion_types)
+        emotions = np.asarray(emotions)
+        if emotions.size == 0:
+            emotions = emotions.reshape(0, len(emotion_types))
+        if emotions.ndim != 2 or emotions.shape[1] != len(emotion_types):
+            raise ValueError('emotions must be an N x len(emotion_types) matrix')
+        if len(timestamps) != emotions.shape[0]:
+            raise ValueError('timestamps and emotions must have the same length')
+
+        df = pd.DataFrame(emotions, columns=emotion_types, copy=False)
+        df.insert(0, 'timestamp', parse_timestamps(timestamps))
+        return cls._from_frame(df, emotion_types)
+
+    @classmethod
+    def from_snapshots(cls, snapshots, emotion_types=None):
+        """بناء المحلل في مرور واحد من صفوف EmotionSnapshot (أو أي صفوف فيها timestamp وemotions_data)
+
+        أنواع المشاعر الافتراضية هي مفاتيح أول صف، كما في المُنشئ العادي.
+        """
+        timestamps = []
+        values = []
+        for snapshot in snapshots:
+            emotions = snapshot.emotions_data
+            if isinstance(emotions, (str, bytes)):
+                emotions = json.loads(emotions) if emotions else {}
+            emotions = emotions or {}
+            if emotion_types is None:
+                emotion_types = list(emotions.keys())
+            timestamps.append(snapshot.timestamp)
+            values.append([emotions.get(emotion_type, 0) for emotion_type in emotion_types])
+
+        return cls.from_arrays(timestamps, values, emotion_types or [])
+
     def _get_emotion_types(self):
         if self.data and "emotion_history_20s" in self.data and self.data["emotion_history_20s"]:
             # Get emotion types from the first entry
@@ -16,15 +79,16 @@ class EmotionAnalyzer:
         return []
 
     def _process_data(self):
-        records = []
-        for entry in self.data["emotion_history_20s"]:
-            timestamp = pd.to_datetime(entry["timestamp"])
-            emotions = entry["emotion_percentage"]
-            record = {"timestamp": timestamp}
-            for emotion_type in self.emotion_types:
-                record[emotion_type] = emotions.get(emotion_type, 0) # Use .get to handle missing emotions
-            records.append(record)
-        return pd.DataFrame(records)
+        # one pass over the entries, then a single vectorized timestamp parse
+        history = self.data["emotion_history_20s"]
+        timestamps = [entry["timestamp"] for entry in history]
+        values = [
+            [entry["emotion_percentage"].get(emotion_type, 0) for emotion_type in self.emotion_types] # Use .get to handle missing emotions
+            for entry in history
+        ]
+        df = pd.DataFrame(values, columns=self.emotion_types)
+        df.insert(0, "timestamp", parse_timestamps(timestamps))
+        return df
 
     def get_processed_data(self):
         return self.df
@@ -63,18 +127,78 @@ class EmotionAnalyzer:
         return self.df[self.emotion_types]
 
     def get_temporal_analysis(self):
-        # Calculate the rate of change for each emotion
-        self.df["time_diff"] = self.df["timestamp"].diff().dt.total_seconds()
-        temporal_df = self.df.copy()
-        for emotion_type in self.emotion_types:
-            temporal_df[f"{emotion_type}_change"] = temporal_df[emotion_type].diff() / temporal_df["time_diff"]
+        # Calculate the rate of change for each emotion (self.df is left untouched)
+        time_diff = self.df["timestamp"].diff().dt.total_seconds()
+        changes = self.df[self.emotion_types].diff().div(time_diff, axis=0).add_suffix("_change")
+        changes.insert(0, "timestamp", self.df["timestamp"])
 
         # Drop the first row which will have NaN for diff calculations
-        temporal_df = temporal_df.dropna(subset=["time_diff"])
+        return changes[time_diff.notna()]
+
+    def _time_ordered(self):
+        # time-based windows need sorted timestamps; only unsorted input pays for a sorted copy
+        if self.df["timestamp"].is_monotonic_increasing:
+            return self.df
+        return self.df.sort_values("timestamp", kind="stable", ignore_index=True)
+
+    def _emotion_columns(self, emotions):
+        if emotions is None:
+            return list(self.emotion_types)
+        unknown = set(emotions) - set(self.emotion_types)
+        if unknown:
+            raise ValueError(f"unknown emotions: {sorted(unknown)}")
+        return list(emotions)
+
+    def get_rolling_analysis(self, window="10s", emotions=None, min_periods=1):
+        """متوسط متحرك وتذبذب (انحراف معياري) لكل عاطفة على نافذة زمنية مثل 10s أو 1min"""
+        columns = self._emotion_columns(emotions)
+        df = self._time_ordered()
+        rolling = df.rolling(window, on="timestamp", min_periods=min_periods)[columns]
+
+        # the `on` column is carried through the rolling result, keep only the emotions
+        result = rolling.mean()[columns].add_suffix("_mean")
+        result = result.join(rolling.std()[columns].add_suffix("_volatility"))
+        result.insert(0, "timestamp", df["timestamp"])
+        return result
 
-        return temporal_df[["timestamp"] + [f"{e}_change" for e in self.emotion_types]]
+    def resample(self, interval="10s", agg="mean", emotions=None):
+        """إعادة التقسيم إلى فترات ثابتة (1s/10s/1min...) بتجميع متجه؛ agg اسم دالة أو قائمة أسماء"""
+        columns = self._emotion_columns(emotions)
+        resampled = self._time_ordered().resample(interval, on="timestamp")[columns].agg(agg)
+        if isinstance(resampled.columns, pd.MultiIndex):
+            resampled.columns = [f"{emotion}_{func}" for emotion, func in resampled.columns]
+        return resampled.reset_index()
+
+    def get_smoothed_emotions(self, halflife="10s", emotions=None):
+        """تنعيم أسي موزون بنصف عمر زمني (يأخذ الفجوات غير المنتظمة بين القراءات في الحساب)"""
+        columns = self._emotion_columns(emotions)
+        df = self._time_ordered()
+        smoothed = df[columns].ewm(halflife=pd.Timedelta(halflife), times=df["timestamp"]).mean()
+        smoothed.insert(0, "timestamp", df["timestamp"])
+        return smoothed
+
+    def get_windowed_summary(self, interval="1min", window="10s", halflife="10s"):
+        """ملخص مضغوط لجلسة طويلة: لكل فترة متوسط القيم وتذبذبها، وآخر قيمة للتنعيم الأسي
+
+        بأنواع JSON أصلية مثل get_full_analysis (الطوابع نصوص، وNaN تصبح None).
+        """
+        summary = self.resample(interval, agg=["mean", "std", "min", "max"])
+        rolling = self.get_rolling_analysis(window)
+        smoothed = self.get_smoothed_emotions(halflife)
+        return {
+            "interval": interval,
+            "window": window,
+            "intervals": _records(summary),
+            "max_volatility": _json_ready({
+                emotion: float(rolling[f"{emotion}_volatility"].max()) for emotion in self.emotion_types
+            }),
+            "smoothed_latest": _json_ready(smoothed.iloc[-1][self.emotion_types].to_dict()) if not smoothed.empty else {}
+        }
 
     def plot_emotion_distribution(self, filename="emotion_distribution.png"):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         emotion_data = self.df[self.emotion_types]
         plt.figure(figsize=(10, 6))
         sns.boxplot(data=emotion_data)
@@ -86,6 +210,8 @@ class EmotionAnalyzer:
         return filename
 
     def plot_temporal_emotions(self, filename="temporal_emotions.png"):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(12, 7))
         for emotion_type in self.emotion_types:
             plt.plot(self.df["timestamp"], self.df[emotion_type], label=emotion_type) # Using emotion_type as label
@@ -117,21 +243,210 @@ class EmotionAnalyzer:
             naive_forecast = {emotion: last_entry[emotion] for emotion in self.emotion_types}
             return {
                 "naive_forecast": naive_forecast,
-                "note": "تنبؤ أولي بناءً على آخر نقطة بيانات بسبب محدودية البيانات. يتطلب نموذجًا أكثر تعقيدًا وبيانات أكبر لتنبؤات دقيقة."
+                "note": FORECAST_NOTE
             }
         else:
-            return {"note": "لا توجد بيانات للتنبؤ."
+            return {"note": NO_DATA_NOTE
             }
 
+    def get_full_analysis(self, include_series=True):
+        """نفس محتوى get_full_analysis_json كقاموس بأنواع JSON أصلية (NaN تصبح None)
+
+        include_series=False يحذف processed_data وtemporal_analysis (بطول عدد القراءات).
+        """
+        analysis_results = {
+            "emotion_statistics": _json_ready(self.get_emotion_statistics()),
+            "identified_patterns": self.identify_patterns(),
+            "predictions": _json_ready(self.predict_emotions())
+        }
+        if include_series:
+            analysis_results["processed_data"] = _records(self.get_processed_data())
+            analysis_results["temporal_analysis"] = _records(self.get_temporal_analysis())
+        return analysis_results
+
     def get_full_analysis_json(self):
+        analysis_results = self.get_full_analysis()
         analysis_results = {
-            "processed_data": self.get_processed_data().to_dict(orient="records"),
+            key: analysis_results[key]
+            for key in ("processed_data", "emotion_statistics", "temporal_analysis", "identified_patterns", "predictions")
+        }
+        return json.dumps(analysis_results, indent=4, default=str)
+
+
+def _json_ready(value):
+    if isinstance(value, dict):
+        return {key: _json_ready(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _records(df):
+    # timestamps as strings in one vectorized pass (same text as str(Timestamp)), NaN/inf as None
+    df = df.astype({"timestamp": str}).replace([np.inf, -np.inf], np.nan)
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+class StreamingEmotionAnalyzer:
+    """نسخة تراكمية من EmotionAnalyzer بذاكرة ثابتة لجلسة تنمو باستمرار
+
+    تستقبل القراءات واحدة أو على دفعات وتحدّث المتوسط والتباين (Welford، ودمج Chan للدفعات)
+    والمجاميع وآخر قيمة وأعلام الاتجاه الرتيب، فتعطي نفس مخرجات get_emotion_statistics
+    وidentify_patterns وpredict_emotions دون إعادة الحساب على كل البيانات.
+    """
+
+    def __init__(self, emotion_types=None):
+        self.emotion_types = list(emotion_types) if emotion_types else []
+        self.count = 0
+        self.last_timestamp = None
+        self._allocate()
+
+    def _allocate(self):
+        size = len(self.emotion_types)
+        self._mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self._sum = np.zeros(size)
+        self._last = np.zeros(size)
+        self._non_decreasing = np.ones(size, dtype=bool)
+        self._non_increasing = np.ones(size, dtype=bool)
+
+    def _row(self, emotions):
+        if not self.emotion_types:
+            # same rule as EmotionAnalyzer: the first reading defines the emotion types
+            self.emotion_types = list(emotions.keys())
+            self._allocate()
+        return [emotions.get(emotion_type, 0) for emotion_type in self.emotion_types]
+
+    def update(self, entry):
+        """إضافة قراءة واحدة بصيغة emotion_history_20s: {"timestamp": ..., "emotion_percentage": {...}}"""
+        self.update_arrays([self._row(entry["emotion_percentage"])], [entry.get("timestamp")])
+        return self
+
+    def update_many(self, entries):
+        """إضافة دفعة قراءات بنفس صيغة update"""
+        entries = list(entries)
+        if entries:
+            values = [self._row(entry["emotion_percentage"]) for entry in entries]
+            self.update_arrays(values, [entry.get("timestamp") for entry in entries])
+        return self
+
+    def update_snapshot_stream(self, snapshots, chunk_size=2000):
+        """استهلاك مكرر صفوف (مثل query.yield_per) على دفعات من chunk_size دون الاحتفاظ بها"""
+        snapshots = iter(snapshots)
+        while True:
+            chunk = list(islice(snapshots, chunk_size))
+            if not chunk:
+                return self
+            self.update_snapshots(chunk)
+
+    def update_snapshots(self, snapshots):
+        """إضافة دفعة من صفوف EmotionSnapshot (timestamp وemotions_data)"""
+        values = []
+        timestamp = None
+        for snapshot in snapshots:
+            emotions = snapshot.emotions_data
+            if isinstance(emotions, (str, bytes)):
+                emotions = json.loads(emotions) if emotions else {}
+            values.append(self._row(emotions or {}))
+            timestamp = snapshot.timestamp
+        if values:
+            self.update_arrays(values, [timestamp])
+        return self
+
+    def update_arrays(self, emotions, timestamps=None):
+        """إضافة مصفوفة N×E مرتبة حسب emotion_types"""
+        chunk = np.asarray(emotions, dtype=float)
+        if chunk.ndim == 1:
+            chunk = chunk.reshape(1, -1)
+        if chunk.shape[0] == 0:
+            return self
+        if chunk.shape[1] != len(self.emotion_types):
+            raise ValueError('emotions must have one column per emotion type')
+
+        n_chunk = chunk.shape[0]
+        chunk_mean = chunk.mean(axis=0)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis=0)
+
+        total = self.count + n_chunk
+        delta = chunk_mean - self._mean
+        self._mean = self._mean + delta * (n_chunk / total)
+        self._m2 = self._m2 + chunk_m2 + delta ** 2 * (self.count * n_chunk / total)
+        self._sum += chunk.sum(axis=0)
+
+        steps = np.diff(chunk, axis=0) if self.count == 0 else np.diff(np.vstack([self._last, chunk]), axis=0)
+        if steps.size:
+            self._non_decreasing &= (steps >= 0).all(axis=0)
+            self._non_increasing &= (steps <= 0).all(axis=0)
+
+        self._last = chunk[-1].copy()
+        self.count = total
+        if timestamps is not None and len(timestamps) and timestamps[-1] is not None:
+            self.last_timestamp = timestamps[-1]
+        return self
+
+    def get_emotion_statistics(self):
+        total_percentages = self._sum.sum()
+        emotion_overall_percentages = {
+            emotion: float(self._sum[i] / total_percentages * 100) if total_percentages > 0 else 0
+            for i, emotion in enumerate(self.emotion_types)
+        }
+
+        if emotion_overall_percentages:
+            most_common_emotion = max(emotion_overall_percentages, key=emotion_overall_percentages.get)
+            least_common_emotion = min(emotion_overall_percentages, key=emotion_overall_percentages.get)
+        else:
+            most_common_emotion = None
+            least_common_emotion = None
+
+        # sample standard deviation (ddof=1), NaN below two readings like pandas
+        std = np.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else np.full(len(self.emotion_types), np.nan)
+        mean = self._mean if self.count else np.full(len(self.emotion_types), np.nan)
+
+        return {
+            "mean_percentages": dict(zip(self.emotion_types, mean.tolist())),
+            "overall_percentages": emotion_overall_percentages,
+            "most_common_emotion": most_common_emotion,
+            "least_common_emotion": least_common_emotion,
+            "standard_deviations": dict(zip(self.emotion_types, std.tolist()))
+        }
+
+    def identify_patterns(self):
+        patterns = {}
+        for i, emotion in enumerate(self.emotion_types):
+            if self._non_decreasing[i]:
+                patterns[emotion] = "Consistent Increase"
+            elif self._non_increasing[i]:
+                patterns[emotion] = "Consistent Decrease"
+            else:
+                patterns[emotion] = "No obvious consistent pattern"
+        return patterns
+
+    def predict_emotions(self):
+        if self.count:
+            return {
+                "naive_forecast": dict(zip(self.emotion_types, self._last.tolist())),
+                "note": FORECAST_NOTE
+            }
+        return {"note": NO_DATA_NOTE}
+
+    def get_full_analysis(self):
+        """نفس مخرجات EmotionAnalyzer.get_full_analysis(include_series=False)"""
+        return {
+            "emotion_statistics": _json_ready(self.get_emotion_statistics()),
+            "identified_patterns": self.identify_patterns(),
+            "predictions": _json_ready(self.predict_emotions())
+        }
+
+    def get_summary(self):
+        return {
+            "readings": self.count,
+            "last_timestamp": self.last_timestamp,
             "emotion_statistics": self.get_emotion_statistics(),
-            "temporal_analysis": self.get_temporal_analysis().to_dict(orient="records"),
             "identified_patterns": self.identify_patterns(),
             "predictions": self.predict_emotions()
         }
-        return json.dumps(analysis_results, indent=4, default=str)
 
 # Example Usage (for testing purposes)
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from models import db
+
+
+class WriteBehindQueue:
+    """طابور كتابة مؤجلة: المسار يضيف العناصر ويعود فوراً، وخيط خلفي يكتبها على دفعات
+
+    handler(items) يُستدعى داخل app_context مع قائمة العناصر المتراكمة ويتولى الـ commit. إذا فشلت دفعة
+    تُقسم إلى نصفين ويُعاد كل نصف حتى يبقى العنصر الفاشل وحده، فيُسقط ويُسجّل دون بقية الدفعة.
+    flush_size يعد ما يُرجعه item_size(item) (مثلاً عدد الصفوف في عنصر هو قائمة صفوف)، وبدونه يعد العناصر.
+    policy عند امتلاء الطابور: 'block' ينتظر حتى enqueue_timeout (None = بلا حد) ثم يرفض،
+    و'drop' يسقط العنصر فوراً.
+    """
+
+    _STOP = object()
+
+    def __init__(self, app, handler, name='write-behind', max_size=1000, flush_size=100,
+                 flush_interval=0.5, enqueue_timeout=0.05, policy='block', item_size=None):
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.app = app
+        self.handler = handler
+        self.name = name
+        self.flush_size = flush_size
+        self.item_size = item_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.policy = policy
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+            'retries': 0,
+            'flushes': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0
+        }
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # a forked worker inherits the object but not the thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def enqueue(self, item):
+        """إضافة عنصر؛ تُرجع False عند امتلاء الطابور (ضغط عكسي على المستدعي)"""
+        self._ensure_started()
+        try:
+            if self.policy == 'block':
+                self._queue.put(item, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            self._count('rejected' if self.policy == 'block' else 'dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            size = self._size(item)
+            stop_requested = False
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop_requested = True
+                    break
+                batch.append(item)
+                size += self._size(item)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop_requested:
+                self._queue.task_done()
+                return
+
+    def _size(self, item):
+        return self.item_size(item) if self.item_size is not None else 1
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                self._write_items(batch)
+            finally:
+                self._on_flush_done()
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats['flushes'] += 1
+            self._stats['last_flush_seconds'] = elapsed
+            self._stats['total_flush_seconds'] += elapsed
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+
+    def _write_items(self, items):
+        try:
+            self.handler(items)
+        except Exception as e:
+            db.session.rollback()
+            if len(items) == 1:
+                self._count('failed')
+                self.app.logger.error(f"{self.name} dropped an item that failed to write: {e}; item: {items[0]!r:.500}")
+                return
+            # bisect so one bad item does not take the rest of the batch with it
+            self._count('retries')
+            middle = len(items) // 2
+            self._write_items(items[:middle])
+            self._write_items(items[middle:])
+        else:
+            self._count('written', len(items))
+
+    def _on_flush_done(self):
+        try:
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+    def flush(self, timeout=None):
+        """انتظار كتابة كل العناصر الحالية؛ تُرجع False عند انتهاء المهلة"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.unfinished_tasks == 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('flushes')
+        total = stats.pop('total_flush_seconds')
+        stats.update({
+            'name': self.name,
+            'depth': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'policy': self.policy,
+            'flushes': flushes,
+            'avg_flush_seconds': total / flushes if flushes else 0.0,
+            'running': self._thread is not None and self._thread.is_alive()
+        })
+        return stats
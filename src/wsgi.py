@@ -0,0 +1,81 @@
+"""نقطة تشغيل الإنتاج: خادم WSGI متعدد العمليات/الخيوط بدلاً من خادم Flask التطويري
+
+    python wsgi.py --server gunicorn --workers 4 --threads 4
+    python wsgi.py --server waitress --threads 16
+    gunicorn -w 4 --threads 4 -b 0.0.0.0:5000 wsgi:app
+"""
+import argparse
+import multiprocessing
+import os
+
+from app import app
+from models import db
+
+application = app
+
+
+def _default_workers():
+    return int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+
+def _dispose_engine():
+    # pooled connections must not be shared between forked workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def run_gunicorn(host, port, workers, threads, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', lambda server, worker: _dispose_engine())
+
+        def load(self):
+            return app
+
+    GunicornApplication().run()
+
+
+def run_waitress(host, port, threads, **kwargs):
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+SERVERS = {
+    'gunicorn': run_gunicorn,
+    'waitress': run_waitress
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='تشغيل نظام تحليل المشاعر بخادم WSGI للإنتاج')
+    parser.add_argument('--server', choices=sorted(SERVERS), default=os.environ.get('WSGI_SERVER', 'gunicorn'))
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=_default_workers(), help='gunicorn فقط')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WSGI_THREADS', 4)))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WSGI_TIMEOUT', 30)))
+    args = parser.parse_args(argv)
+
+    try:
+        SERVERS[args.server](
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            threads=args.threads,
+            timeout=args.timeout
+        )
+    except ImportError:
+        parser.error(f'{args.server} is not installed: pip install {args.server}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import pytest
+
+from ingest import SnapshotValidationError, build_snapshot_rows
+
+
+def reading(**overrides):
+    data = {
+        'emotions': {'happy': 80.0, 'sad': 20.0},
+        'face_data': {'face_detected': True, 'face_count': 1, 'face_confidence': 0.9},
+        'age_gender_data': {'age': 30, 'gender': 'male', 'age_confidence': 0.8, 'gender_confidence': 0.7},
+        'timestamp': 1700000000000
+    }
+    for section, values in overrides.items():
+        if isinstance(values, dict) and isinstance(data.get(section), dict):
+            data[section] = dict(data[section], **values)
+        else:
+            data[section] = values
+    return data
+
+
+def test_valid_reading_builds_row():
+    row, = build_snapshot_rows(1, 's', [reading()])
+    assert row['dominant_emotion'] == 'happy'
+    assert row['face_count'] == 1
+    assert row['detected_gender'] == 'male'
+
+
+@pytest.mark.parametrize('overrides', [
+    {'face_data': {'face_confidence': 'abc'}},
+    {'face_data': {'face_confidence': float('nan')}},
+    {'face_data': {'face_confidence': True}},
+    {'face_data': {'face_count': '1'}},
+    {'face_data': {'face_count': float('inf')}},
+    {'face_data': {'face_detected': 'yes'}},
+    {'face_data': {'face_detected': 1}},
+    {'age_gender_data': {'age': 'thirty'}},
+    {'age_gender_data': {'age': False}},
+    {'age_gender_data': {'age_confidence': [0.5]}},
+    {'age_gender_data': {'gender_confidence': {'value': 0.5}}},
+    {'age_gender_data': {'gender': 1}},
+    {'emotions': {'happy': 'high'}},
+    {'emotions': {'happy': None}},
+    {'note': {'text': 'x'}},
+    {'timestamp': 10 ** 30}
+])
+def test_bad_field_types_are_rejected_with_index(overrides):
+    with pytest.raises(SnapshotValidationError) as error:
+        build_snapshot_rows(1, 's', [reading(), reading(**overrides)])
+    assert error.value.index == 1
+
+
+def test_optional_fields_may_be_null():
+    row, = build_snapshot_rows(1, 's', [reading(
+        face_data={'face_confidence': None, 'face_count': None, 'face_detected': None},
+        age_gender_data={'age': None, 'gender': None}
+    )])
+    assert row['face_count'] == 0
+    assert row['face_detected'] is False
+    assert row['detected_gender'] is None
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from utils import EmotionAnalyzer, StreamingEmotionAnalyzer
+
+
+def test_windowed_summary_is_strict_json():
+    # one reading per emotion window: std and volatility are NaN, timestamps are pandas Timestamps
+    analyzer = EmotionAnalyzer.from_arrays(
+        [1700000000000, 1700000030000, 1700000090000],
+        [[0.5, 0.1], [0.6, 0.2], [0.7, 0.3]],
+        ['happy', 'sad']
+    )
+    summary = analyzer.get_windowed_summary(interval='1min', window='1s')
+
+    decoded = json.loads(json.dumps(summary, allow_nan=False))
+    assert decoded['max_volatility'] == {'happy': None, 'sad': None}
+    assert isinstance(decoded['intervals'][0]['timestamp'], str)
+    assert decoded['intervals'][0]['happy_std'] is not None
+    assert decoded['intervals'][1]['happy_std'] is None
+    assert decoded['smoothed_latest']['happy'] > 0.6
+
+
+def test_streaming_full_analysis_matches_batch_analyzer():
+    start = datetime(2026, 1, 1)
+    snapshots = [
+        SimpleNamespace(timestamp=start + timedelta(seconds=i), emotions_data=json.dumps({'happy': 10 + i, 'sad': 50 - i * (i % 3)}))
+        for i in range(25)
+    ]
+    expected = EmotionAnalyzer.from_snapshots(snapshots, emotion_types=['happy', 'sad']).get_full_analysis(include_series=False)
+    result = StreamingEmotionAnalyzer(['happy', 'sad']).update_snapshot_stream(iter(snapshots), chunk_size=4).get_full_analysis()
+
+    assert result['identified_patterns'] == expected['identified_patterns']
+    assert result['predictions'] == expected['predictions']
+    for key, values in expected['emotion_statistics'].items():
+        if isinstance(values, dict):
+            assert result['emotion_statistics'][key] == pytest.approx(values)
+        else:
+            assert result['emotion_statistics'][key] == values